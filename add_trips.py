@@ -11,7 +11,8 @@ JSON Format Expected by Templates:
 
 from app import app, db
 from models import User, Trip
-import json
+from bulk_import import import_trips
+from deletions import delete_trips
 import uuid
 
 def create_sample_trips():
@@ -27,14 +28,13 @@ def create_sample_trips():
         print(f"Creating trips for user: {user.name} ({user.email})")
         
         # Delete existing trips for this user to avoid duplicates
-        existing_trips = Trip.query.filter_by(user_id=user_id).all()
-        for trip in existing_trips:
-            db.session.delete(trip)
-        db.session.commit()
-        print(f"Deleted {len(existing_trips)} existing trips")
+        existing_trips = db.session.execute(db.select(Trip.trip_id).filter_by(user_id=user_id)).scalars().all()
+        print(f"Deleted {delete_trips(existing_trips)} existing trips")
         
+        trips = []
+
         # Trip 1: Rajasthan Heritage Tour (heritage category)
-        trip1 = Trip(
+        trip1 = dict(
             trip_id=str(uuid.uuid4()),
             user_id=user_id,
             trip_name='Royal Rajasthan Heritage Tour',
@@ -45,7 +45,7 @@ def create_sample_trips():
             end_date='2026-02-10',
             total_budget=45000,
             is_public=True,
-            itinerary_json=json.dumps({
+            itinerary={
                 'stops': [
                     {
                         'city_name': 'Jaipur',
@@ -128,13 +128,13 @@ def create_sample_trips():
                         ]
                     }
                 ]
-            })
+            }
         )
-        db.session.add(trip1)
-        print("✓ Created Trip 1: Royal Rajasthan Heritage Tour")
+        trips.append(trip1)
+        print("✓ Prepared Trip 1: Royal Rajasthan Heritage Tour")
 
         # Trip 2: Kerala Backwaters & Nature (nature category)
-        trip2 = Trip(
+        trip2 = dict(
             trip_id=str(uuid.uuid4()),
             user_id=user_id,
             trip_name='Kerala - Gods Own Country',
@@ -145,7 +145,7 @@ def create_sample_trips():
             end_date='2026-03-24',
             total_budget=55000,
             is_public=True,
-            itinerary_json=json.dumps({
+            itinerary={
                 'stops': [
                     {
                         'city_name': 'Kochi',
@@ -228,13 +228,13 @@ def create_sample_trips():
                         ]
                     }
                 ]
-            })
+            }
         )
-        db.session.add(trip2)
-        print("✓ Created Trip 2: Kerala - Gods Own Country")
+        trips.append(trip2)
+        print("✓ Prepared Trip 2: Kerala - Gods Own Country")
 
         # Trip 3: Tamil Nadu Temple Trail (pilgrimage category)
-        trip3 = Trip(
+        trip3 = dict(
             trip_id=str(uuid.uuid4()),
             user_id=user_id,
             trip_name='Tamil Nadu Divine Temple Trail',
@@ -245,7 +245,7 @@ def create_sample_trips():
             end_date='2026-04-18',
             total_budget=35000,
             is_public=True,
-            itinerary_json=json.dumps({
+            itinerary={
                 'stops': [
                     {
                         'city_name': 'Chennai',
@@ -328,13 +328,13 @@ def create_sample_trips():
                         ]
                     }
                 ]
-            })
+            }
         )
-        db.session.add(trip3)
-        print("✓ Created Trip 3: Tamil Nadu Divine Temple Trail")
+        trips.append(trip3)
+        print("✓ Prepared Trip 3: Tamil Nadu Divine Temple Trail")
 
         # Trip 4: Himalayan Adventure (adventure category)
-        trip4 = Trip(
+        trip4 = dict(
             trip_id=str(uuid.uuid4()),
             user_id=user_id,
             trip_name='Himalayan Adventure Expedition',
@@ -345,7 +345,7 @@ def create_sample_trips():
             end_date='2026-05-10',
             total_budget=60000,
             is_public=True,
-            itinerary_json=json.dumps({
+            itinerary={
                 'stops': [
                     {
                         'city_name': 'Rishikesh',
@@ -419,16 +419,21 @@ def create_sample_trips():
                         ]
                     }
                 ]
-            })
+            }
         )
-        db.session.add(trip4)
-        print("✓ Created Trip 4: Himalayan Adventure Expedition")
+        trips.append(trip4)
+        print("✓ Prepared Trip 4: Himalayan Adventure Expedition")
 
-        # Commit all trips
-        db.session.commit()
+        # Write all trips in one batch (blobs, summaries and analytics included)
+        report = import_trips(enumerate(trips, 1))
+        for error in report['errors']:
+            print(f"Skipped trip {error}")
         
         print("\n" + "="*50)
-        print("Successfully created 4 trips!")
+        if report['rejected']:
+            print(f"Created {report['rows']} of {len(trips)} trips ({report['rejected']} rejected)")
+        else:
+            print(f"Successfully created {report['rows']} trips!")
         print("="*50)
         print(f"User: {user.name} ({user.email})")
         print("-"*50)
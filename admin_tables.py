@@ -0,0 +1,173 @@
+"""
+Payanam - Admin Tables
+Cached COUNT(*) stats and paginated, sortable, filterable listings for the admin panel
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime
+from sqlalchemy import Integer, cast, func, and_, or_
+from models import db, User, Trip, City, Activity, UserStat, Job
+from pagination import keyset_page, DEFAULT_PAGE_SIZE
+
+DEFAULT_STATS_TTL = 30  # seconds
+
+_stats = {'value': None, 'expires': 0.0}
+_stats_lock = threading.Lock()
+
+
+class ListingError(ValueError):
+    """Raised for an unknown table, sort key or filter value"""
+
+
+def admin_stats():
+    """Row counts of the main tables, recomputed at most every ADMIN_STATS_TTL seconds"""
+    now = time.monotonic()
+    with _stats_lock:
+        if _stats['value'] is not None and now < _stats['expires']:
+            return _stats['value']
+
+    value = {
+        'total_users': db.session.query(func.count(User.user_id)).scalar(),
+        'total_trips': db.session.query(func.count(Trip.trip_id)).scalar(),
+        'total_cities': db.session.query(func.count(City.city_id)).scalar(),
+        'total_activities': db.session.query(func.count(Activity.activity_id)).scalar(),
+    }
+    with _stats_lock:
+        _stats['value'] = value
+        _stats['expires'] = now + float(os.getenv('ADMIN_STATS_TTL', DEFAULT_STATS_TTL))
+    return value
+
+
+def invalidate_admin_stats():
+    """Drop the cached counts, e.g. after the admin adds or deletes a row"""
+    with _stats_lock:
+        _stats['value'] = None
+
+
+# ============== LISTINGS ==============
+
+def _users_query():
+    # Trip counts come from the analytics counters, not a COUNT per user
+    trip_count = cast(func.coalesce(UserStat.value, 0), Integer).label('trip_count')
+    return db.session.query(User.user_id, User.name, User.email, User.created_at, trip_count).outerjoin(
+        UserStat, and_(UserStat.user_id == User.user_id, UserStat.metric == 'total_trips', UserStat.key == ''))
+
+
+def _trips_query():
+    # Listing columns only: no itinerary blob, no summary
+    return db.session.query(
+        Trip.trip_id, Trip.trip_name, Trip.trip_category, Trip.start_date, Trip.end_date,
+        Trip.total_budget, Trip.is_public, Trip.created_at, Trip.user_id, User.name.label('owner_name')
+    ).outerjoin(User, User.user_id == Trip.user_id)
+
+
+def _cities_query():
+    return db.session.query(
+        City.city_id, City.name, City.state, City.category, City.image_url,
+        City.popular_score, City.activity_count, City.created_at
+    )
+
+
+def _activities_query():
+    return db.session.query(
+        Activity.activity_id, Activity.name, Activity.category, Activity.duration_hours,
+        Activity.estimated_cost, Activity.rating, Activity.created_at, Activity.city_id,
+        City.name.label('city_name'), City.state.label('state')
+    ).outerjoin(City, City.city_id == Activity.city_id)
+
+
+def _jobs_query():
+    # Payloads and results stay out of the listing; /admin/api/jobs/<job_id> has them
+    return db.session.query(
+        Job.job_id, Job.kind, Job.status, Job.attempts, Job.max_attempts, Job.error, Job.user_id,
+        Job.run_after, Job.created_at, Job.finished_at
+    )
+
+
+def _flag(value):
+    if value not in ('true', 'false', '1', '0'):
+        raise ListingError(f"Invalid boolean {value!r}")
+    return value in ('true', '1')
+
+
+# name -> query, primary key, sort keys (first is the default), ?q= columns, ?<filter>= columns
+ADMIN_TABLES = {
+    'users': {
+        'query': _users_query,
+        'key': User.user_id,
+        'sorts': {'created_at': User.created_at, 'name': User.name, 'email': User.email},
+        'search': (User.name, User.email),
+        'filters': {},
+    },
+    'trips': {
+        'query': _trips_query,
+        'key': Trip.trip_id,
+        'sorts': {'created_at': Trip.created_at, 'start_date': Trip.start_date,
+                  'total_budget': Trip.total_budget, 'trip_name': Trip.trip_name},
+        'search': (Trip.trip_name,),
+        'filters': {'user_id': (Trip.user_id, str), 'category': (Trip.trip_category, str),
+                    'is_public': (Trip.is_public, _flag)},
+    },
+    'cities': {
+        'query': _cities_query,
+        'key': City.city_id,
+        'sorts': {'popular_score': City.popular_score, 'name': City.name,
+                  'activity_count': City.activity_count, 'created_at': City.created_at},
+        'search': (City.name, City.state),
+        'filters': {'state': (City.state, str), 'category': (City.category, str)},
+    },
+    'activities': {
+        'query': _activities_query,
+        'key': Activity.activity_id,
+        'sorts': {'rating': Activity.rating, 'estimated_cost': Activity.estimated_cost,
+                  'name': Activity.name, 'created_at': Activity.created_at},
+        'search': (Activity.name,),
+        'filters': {'city_id': (Activity.city_id, str), 'category': (Activity.category, str)},
+    },
+    'jobs': {
+        'query': _jobs_query,
+        'key': Job.job_id,
+        'sorts': {'created_at': Job.created_at},
+        'search': (Job.kind, Job.error),
+        'filters': {'status': (Job.status, str), 'kind': (Job.kind, str), 'user_id': (Job.user_id, str)},
+    },
+}
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def admin_page(table, args, limit=DEFAULT_PAGE_SIZE):
+    """One keyset page of an admin table for the request `args`:
+    ?sort=<key>&order=asc|desc, ?q=<text>, the table's filters and ?cursor=.
+
+    Returns (rows as dicts, next_cursor).
+    """
+    spec = ADMIN_TABLES.get(table)
+    if spec is None:
+        raise ListingError(f"Unknown table {table!r}")
+    sort = args.get('sort') or next(iter(spec['sorts']))
+    if sort not in spec['sorts']:
+        raise ListingError(f"Cannot sort {table} by {sort!r}; use one of {', '.join(spec['sorts'])}")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ListingError("order must be 'asc' or 'desc'")
+
+    query = spec['query']()
+    search = args.get('q', '').strip()
+    if search:
+        query = query.filter(or_(*(column.contains(search, autoescape=True) for column in spec['search'])))
+    for name, (column, convert) in spec['filters'].items():
+        if args.get(name):
+            query = query.filter(column == convert(args[name]))
+
+    names = [description['name'] for description in query.column_descriptions]
+    descending = order == 'desc'
+    rows, next_cursor = keyset_page(query, [(spec['sorts'][sort], descending), (spec['key'], descending)],
+                                    cursor=args.get('cursor'), limit=limit)
+    return [{name: _plain(value) for name, value in zip(names, row)} for row in rows], next_cursor
@@ -0,0 +1,178 @@
+"""
+Payanam - User Analytics
+Per-user analytics counters kept up to date incrementally as trips change
+"""
+
+import json
+from datetime import datetime
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert
+from models import db, User, Trip, UserStat, ItineraryBlob
+from itinerary_stats import summarize
+from itinerary_store import trip_itinerary_texts
+from jobs import job_handler
+
+# Metrics that are counts (served as ints); total_budget is a float sum
+COUNT_METRICS = ('total_trips', 'city_visits', 'activity_types', 'category_count', 'monthly_trips')
+MAP_METRICS = ('city_visits', 'activity_types', 'category_count', 'monthly_trips')
+
+
+def trip_contribution(trip_category, total_budget, created_at, summary):
+    """What one trip adds to its owner's counters, as {(metric, key): value}"""
+    created_at = created_at or datetime.utcnow()
+    contribution = {
+        ('total_trips', ''): 1,
+        ('total_budget', ''): total_budget or 0.0,
+        ('category_count', trip_category): 1,
+        ('monthly_trips', created_at.strftime('%Y-%m')): 1
+    }
+    for city, count in summary.get('city_visits', {}).items():
+        contribution[('city_visits', city)] = count
+    for act_type, count in summary.get('activity_types', {}).items():
+        contribution[('activity_types', act_type)] = count
+    return contribution
+
+
+def _parse_summary(summary_json, load_itinerary_json):
+    """The stored summary, or one computed from the itinerary text if missing"""
+    if summary_json:
+        return json.loads(summary_json)
+    try:
+        return summarize(json.loads(load_itinerary_json()))
+    except (TypeError, ValueError):
+        return summarize({})
+
+
+def _committed(trip, attr):
+    """Value of `attr` as of the last flush, even if it has been modified since"""
+    history = inspect(trip).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(trip, attr)
+
+
+def _old_contribution(trip):
+    return _committed(trip, 'user_id'), trip_contribution(
+        _committed(trip, 'trip_category'), _committed(trip, 'total_budget'), _committed(trip, 'created_at'),
+        _parse_summary(_committed(trip, 'summary_json'),
+                       lambda: ItineraryBlob.load_text(_committed(trip, 'itinerary_hash')))
+    )
+
+
+def _new_contribution(trip):
+    return trip.user_id, trip_contribution(
+        trip.trip_category, trip.total_budget, trip.created_at,
+        _parse_summary(trip.summary_json, lambda: trip.itinerary_json)
+    )
+
+
+def accumulate(deltas, user_id, contribution, sign):
+    user_deltas = deltas.setdefault(user_id, {})
+    for (metric, key), value in contribution.items():
+        counter = (metric, '' if key is None else str(key))
+        user_deltas[counter] = user_deltas.get(counter, 0) + sign * value
+
+
+def apply_deltas(conn, deltas):
+    """Add per-user counter deltas with atomic upserts, then drop emptied counters"""
+    for user_id, user_deltas in deltas.items():
+        rows = [
+            {'user_id': user_id, 'metric': metric, 'key': key, 'value': value}
+            for (metric, key), value in user_deltas.items() if value
+        ]
+        if not rows:
+            continue
+        stmt = insert(UserStat.__table__)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'metric', 'key'],
+            set_={'value': UserStat.__table__.c.value + stmt.excluded.value}
+        ), rows)
+        conn.execute(text(
+            "DELETE FROM user_stats WHERE user_id = :user_id AND metric != 'total_budget' AND value <= 0"
+        ), {'user_id': user_id})
+
+
+@event.listens_for(Session, 'before_flush')
+def _refresh_trip_summaries(session, flush_context, instances):
+    """Keep Trip.summary_json in step with itineraries assigned directly
+    (copies, seed scripts) rather than through Trip.set_itinerary()"""
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Trip):
+            continue
+        attrs = inspect(obj).attrs
+        if obj.summary_json is None or (
+            attrs.itinerary_hash.history.has_changes() and not attrs.summary_json.history.has_changes()
+        ):
+            obj.summary_json = json.dumps(summarize(obj.get_itinerary()))
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_user_stats(session, flush_context):
+    """Turn the Trip inserts/updates/deletes of this flush into counter deltas"""
+    deltas = {}
+    deleted_users = set()
+
+    for obj in session.new:
+        if isinstance(obj, Trip):
+            accumulate(deltas, *_new_contribution(obj), 1)
+    for obj in session.dirty:
+        if isinstance(obj, Trip) and session.is_modified(obj, include_collections=False):
+            accumulate(deltas, *_old_contribution(obj), -1)
+            accumulate(deltas, *_new_contribution(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Trip):
+            accumulate(deltas, *_old_contribution(obj), -1)
+        elif isinstance(obj, User):
+            deleted_users.add(obj.user_id)
+
+    conn = session.connection()
+    for user_id in deleted_users:
+        deltas.pop(user_id, None)
+        conn.execute(text("DELETE FROM user_stats WHERE user_id = :user_id"), {'user_id': user_id})
+    apply_deltas(conn, deltas)
+
+
+def rebuild_user_stats(conn, user_id=None):
+    """Recompute counters from scratch for one user, or for everyone"""
+    stats = UserStat.__table__
+    trips = Trip.__table__
+    query = select(trips.c.trip_id, trips.c.user_id, trips.c.trip_category, trips.c.total_budget,
+                   trips.c.created_at, trips.c.summary_json)
+    if user_id:
+        conn.execute(stats.delete().where(stats.c.user_id == user_id))
+        query = query.where(trips.c.user_id == user_id)
+    else:
+        conn.execute(stats.delete())
+
+    deltas = {}
+    for trip_id, owner, trip_category, total_budget, created_at, summary_json in conn.execute(query).fetchall():
+        accumulate(deltas, owner, trip_contribution(
+            trip_category, total_budget, created_at,
+            _parse_summary(summary_json, lambda: trip_itinerary_texts(conn, [trip_id]).get(trip_id))
+        ), 1)
+    apply_deltas(conn, deltas)
+
+
+@job_handler('rebuild_analytics')
+def _rebuild_user_stats_job(payload):
+    """Background rebuild-analytics, for one user ({"user_id": ...}) or everyone"""
+    with db.engine.begin() as conn:
+        rebuild_user_stats(conn, payload.get('user_id'))
+    return {'user_id': payload.get('user_id')}
+
+
+def user_analytics(user_id):
+    """A user's analytics rollup, read with a single primary-key range scan"""
+    result = {'total_trips': 0, 'total_budget': 0.0}
+    for metric in MAP_METRICS:
+        result[metric] = {}
+
+    for metric, key, value in db.session.query(UserStat.metric, UserStat.key, UserStat.value).filter(
+            UserStat.user_id == user_id):
+        value = int(round(value)) if metric in COUNT_METRICS else value
+        if metric in MAP_METRICS:
+            result[metric][key] = value
+        else:
+            result[metric] = value
+    return result
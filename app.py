@@ -4,18 +4,53 @@ A beautiful, UI-focused travel planning application for exploring India
 """
 
 import os
+import uuid
+import click
+from datetime import date, datetime, timedelta
 from functools import wraps
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
-from models import db, User, Trip, City, Activity
+from flask import (Flask, render_template, request, jsonify, redirect, url_for, session, g, stream_with_context, abort,
+                   send_from_directory)
+from flask.cli import AppGroup
+from models import db, User, Trip, City, Activity, Job
+from migrations import upgrade as upgrade_database
+from search import search_cities, search_activities
+from autocomplete import city_index, activity_index
+from itinerary_patch import apply_patch, PatchError
+from itinerary_stats import budget_breakdown
+from analytics import user_analytics, rebuild_user_stats
+from itinerary_tables import backfill_itinerary_rows, most_planned_activities
+from catalog import (snapshot_response, build_cities_frontend_format,
+                     build_activities_frontend_format, build_city_detail, activities_frontend_query,
+                     activity_frontend_format)
+from http_cache import ITINERARY_CACHE_CONTROL, make_etag, conditional_response
+from compression import compress_response
+from shared_pages import get_page, store_page, page_version
+from itinerary_cache import cache_stats as itinerary_cache_stats
+from pagination import keyset_page, page_size, CursorError
+from trip_dates import DateError, parse_date, month_range, overlapping
+from deletions import delete_trips, delete_city, request_user_deletion
+from admin_tables import ADMIN_TABLES, ListingError, admin_stats, admin_page, invalidate_admin_stats
+from query_plans import check_query_plans
+from page_scripts import check_page_scripts
+from jobs import enqueue, retry_job, prune_jobs, run_worker, start_worker_thread
+import bulk_import
+from bulk_export import KINDS as EXPORT_KINDS, FORMATS as EXPORT_FORMATS, export_chunks
+import sqlite_profile
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'payanam-secret-key-2026'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///payanam.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///payanam.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# WAL, synchronous, cache and pool settings (DB_PROFILE / SQLITE_* / DB_POOL_*)
+sqlite_profile.configure(app)
+# Optional directory that persists rendered shared-trip pages across restarts and workers
+app.config['SHARED_PAGE_CACHE_DIR'] = os.getenv('SHARED_PAGE_CACHE_DIR')
+# Finished background exports (admin export jobs)
+app.config['EXPORT_DIR'] = os.getenv('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
 
 # Admin credentials from environment
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
@@ -24,6 +59,77 @@ ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin')
 # Initialize db with app
 db.init_app(app)
 
+# gzip/brotli for clients that accept it
+app.after_request(compress_response)
+
+
+@app.errorhandler(CursorError)
+def invalid_cursor(error):
+    return jsonify({'error': str(error)}), 400
+
+
+@app.errorhandler(DateError)
+def invalid_date(error):
+    return jsonify({'error': str(error)}), 400
+
+
+@app.errorhandler(ListingError)
+def invalid_listing(error):
+    return jsonify({'error': str(error)}), 400
+
+
+def paginate(query, order):
+    """One keyset page of `query` for the request's ?cursor= and ?limit="""
+    return keyset_page(query, order, cursor=request.args.get('cursor'),
+                       limit=page_size(request.args.get('limit', type=int)))
+
+
+# ============== IDENTITY ==============
+
+@app.before_request
+def load_identity():
+    """Who is asking. The User row itself is only loaded by current_user(),
+    so catalog and cache-hit requests stay query-free."""
+    g.user_id = session.get('user_id')
+
+
+def current_user():
+    """The logged-in User, loaded at most once per request"""
+    if 'user' not in g:
+        g.user = db.session.get(User, g.user_id) if g.user_id else None
+    return g.user
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if g.user_id is None:
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if g.user_id is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def trip_access(allow_public=False):
+    """Filter for trips the current user may see: their own, plus public
+    trips when `allow_public` is set"""
+    owned = Trip.user_id == g.user_id
+    return db.or_(owned, Trip.is_public.is_(True)) if allow_public else owned
+
+
+def load_trip(trip_id, allow_public=False):
+    """Fetch a trip and check access in one query; 404 when it does not
+    exist or belongs to someone else"""
+    return Trip.query.filter(Trip.trip_id == trip_id, trip_access(allow_public)).first_or_404()
+
 
 # ============== ROUTES ==============
 
@@ -39,6 +145,8 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email')
         user = User.query.filter_by(email=email).first()
+        if user and user.deactivated_at is not None:
+            return render_template('login.html', error='This account is being deleted.')
         if user:
             session['user_id'] = user.user_id
             session['user_name'] = user.name
@@ -76,35 +184,33 @@ def logout():
 
 # Dashboard
 @app.route('/dashboard')
+@login_required
 def dashboard():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    trips = Trip.query.filter_by(user_id=session['user_id']).order_by(Trip.created_at.desc()).all()
+    user = current_user()
+    trips = Trip.summary_query().filter_by(user_id=g.user_id).order_by(Trip.created_at.desc()).all()
+    upcoming_count = db.session.query(db.func.count(Trip.trip_id)).filter(
+        Trip.user_id == g.user_id, Trip.start_date >= date.today()).scalar()
     
     # Get popular cities and activities for dashboard
     popular_cities = City.query.order_by(City.popular_score.desc()).limit(6).all()
-    popular_activities = Activity.query.order_by(Activity.rating.desc()).limit(6).all()
+    popular_activities = Activity.query_with_city().order_by(Activity.rating.desc()).limit(6).all()
     
     # Convert to dicts for JSON serialization in template
-    trips_data = [t.to_dict() for t in trips]
+    trips_data = [t.to_summary_dict() for t in trips]
     cities_data = [c.to_dict() for c in popular_cities]
     activities_data = [a.to_dict() for a in popular_activities]
     
-    return render_template('dashboard.html', user=user, trips=trips_data,
+    return render_template('dashboard.html', user=user, trips=trips_data, upcoming_count=upcoming_count,
                           popular_cities=cities_data, popular_activities=activities_data)
 
 
 # Trip Routes
 @app.route('/trip/create', methods=['GET', 'POST'])
+@login_required
 def create_trip():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
     if request.method == 'POST':
         trip = Trip(
-            user_id=session['user_id'],
+            user_id=g.user_id,
             trip_name=request.form.get('trip_name'),
             trip_description=request.form.get('trip_description', ''),
             trip_category=request.form.get('trip_category', 'leisure'),
@@ -120,30 +226,22 @@ def create_trip():
 
 
 @app.route('/trips')
+@login_required
 def my_trips():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    trips = Trip.query.filter_by(user_id=session['user_id']).order_by(Trip.created_at.desc()).all()
+    trips = Trip.summary_query().filter_by(user_id=g.user_id).order_by(Trip.created_at.desc()).all()
     return render_template('my_trips.html', trips=trips)
 
 
 @app.route('/trip/<trip_id>')
 def view_trip(trip_id):
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session.get('user_id') and not trip.is_public:
-        return redirect(url_for('login'))
+    trip = load_trip(trip_id, allow_public=True)
     return render_template('view_trip.html', trip=trip)
 
 
 @app.route('/trip/<trip_id>/edit', methods=['GET', 'POST'])
+@login_required
 def edit_trip(trip_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return redirect(url_for('dashboard'))
+    trip = load_trip(trip_id)
     
     if request.method == 'POST':
         trip.trip_name = request.form.get('trip_name')
@@ -159,78 +257,93 @@ def edit_trip(trip_id):
 
 
 @app.route('/trip/<trip_id>/delete', methods=['POST'])
+@api_login_required
 def delete_trip(trip_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return jsonify({'error': 'Unauthorized'}), 401
+    db.session.query(Trip.trip_id).filter(Trip.trip_id == trip_id, trip_access()).first_or_404()
     
-    db.session.delete(trip)
-    db.session.commit()
+    delete_trips([trip_id])
     return jsonify({'success': True})
 
 
 # Itinerary Builder
 @app.route('/trip/<trip_id>/itinerary')
+@login_required
 def itinerary_builder(trip_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return redirect(url_for('dashboard'))
+    trip = load_trip(trip_id)
     
     return render_template('itinerary_builder.html', trip=trip)
 
 
 @app.route('/trip/<trip_id>/timeline')
 def trip_timeline(trip_id):
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session.get('user_id') and not trip.is_public:
-        return redirect(url_for('login'))
+    trip = load_trip(trip_id, allow_public=True)
     return render_template('timeline.html', trip=trip)
 
 
 @app.route('/trip/<trip_id>/budget')
+@login_required
 def trip_budget(trip_id):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return redirect(url_for('dashboard'))
+    trip = load_trip(trip_id)
     
     return render_template('budget.html', trip=trip)
 
 
 # API Routes
-@app.route('/api/trip/<trip_id>/itinerary', methods=['GET', 'POST'])
+@app.route('/api/trip/<trip_id>/itinerary', methods=['GET', 'POST', 'PATCH'])
 def api_itinerary(trip_id):
-    trip = Trip.query.get_or_404(trip_id)
-    
     if request.method == 'GET':
-        return jsonify(trip.get_itinerary())
+        # Validate against the version columns before touching the itinerary body
+        version, updated_at = db.session.query(Trip.itinerary_version, Trip.updated_at).filter(
+            Trip.trip_id == trip_id, trip_access(allow_public=True)).first_or_404()
+        response = conditional_response(
+            make_etag(trip_id, version, updated_at.isoformat() if updated_at else ''),
+            lambda: jsonify(db.session.get(Trip, trip_id).read_itinerary()),
+            ITINERARY_CACHE_CONTROL
+        )
+        response.headers['X-Itinerary-Version'] = str(version)
+        return response
     
-    if request.method == 'POST':
-        if 'user_id' not in session or trip.user_id != session['user_id']:
-            return jsonify({'error': 'Unauthorized'}), 401
-        
-        data = request.get_json()
-        trip.set_itinerary(data)
-        db.session.commit()
-        return jsonify({'success': True})
+    if g.user_id is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+    trip = load_trip(trip_id)
+    
+    data = request.get_json()
+    
+    if request.method == 'PATCH':
+        # { "version": <base version>, "ops": [ RFC 6902 operations ] }
+        if not isinstance(data, dict) or 'version' not in data:
+            return jsonify({'error': 'Missing itinerary version'}), 400
+        base = data['version']
+        if base != trip.itinerary_version:
+            return jsonify({'error': 'Version conflict', 'version': trip.itinerary_version}), 409
+        try:
+            data = apply_patch(trip.get_itinerary(), data.get('ops', []))
+        except PatchError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        # A full save is conditional when the client names its base version
+        base = request.headers.get('X-Itinerary-Version', trip.itinerary_version, type=int)
+    
+    if not isinstance(data, dict) or not isinstance(data.get('stops', []), list):
+        return jsonify({'error': 'Invalid itinerary'}), 400
+    
+    # Another save may have committed since the trip was read
+    if not trip.claim_itinerary_version(base):
+        db.session.rollback()
+        return jsonify({'error': 'Version conflict', 'version': trip.itinerary_version}), 409
+    
+    # Budget is derived here, in the same commit, rather than posted by the client
+    budget = budget_breakdown(data)
+    trip.set_itinerary(data)
+    trip.total_budget = budget['total_budget']
+    db.session.commit()
+    return jsonify({'success': True, 'version': trip.itinerary_version, 'budget': budget})
 
 
 @app.route('/api/trip/<trip_id>/budget', methods=['POST'])
+@api_login_required
 def api_update_budget(trip_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return jsonify({'error': 'Unauthorized'}), 401
+    trip = load_trip(trip_id)
     
     data = request.get_json()
     trip.total_budget = data.get('total_budget', 0)
@@ -239,13 +352,9 @@ def api_update_budget(trip_id):
 
 
 @app.route('/api/trip/<trip_id>/toggle-public', methods=['POST'])
+@api_login_required
 def api_toggle_public(trip_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return jsonify({'error': 'Unauthorized'}), 401
+    trip = load_trip(trip_id)
     
     trip.is_public = not trip.is_public
     db.session.commit()
@@ -253,13 +362,9 @@ def api_toggle_public(trip_id):
 
 
 @app.route('/api/trip/<trip_id>/update', methods=['PUT'])
+@api_login_required
 def api_update_trip(trip_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return jsonify({'error': 'Unauthorized'}), 401
+    trip = load_trip(trip_id)
     
     data = request.get_json()
     trip.trip_name = data.get('trip_name', trip.trip_name)
@@ -276,50 +381,65 @@ def api_update_trip(trip_id):
 
 
 @app.route('/api/trip/<trip_id>/delete', methods=['DELETE'])
+@api_login_required
 def api_delete_trip(trip_id):
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    trip = Trip.query.get_or_404(trip_id)
-    if trip.user_id != session['user_id']:
-        return jsonify({'error': 'Unauthorized'}), 401
+    db.session.query(Trip.trip_id).filter(Trip.trip_id == trip_id, trip_access()).first_or_404()
     
-    db.session.delete(trip)
-    db.session.commit()
+    delete_trips([trip_id])
     return jsonify({'success': True})
 
 
 @app.route('/api/trips')
+@api_login_required
 def api_get_trips():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    limit = request.args.get('limit', type=int)
-    query = Trip.query.filter_by(user_id=session['user_id']).order_by(Trip.created_at.desc())
-    
-    if limit:
-        query = query.limit(limit)
-    
-    trips = query.all()
-    return jsonify({'trips': [t.to_dict() for t in trips]})
+    query = Trip.summary_query().filter_by(user_id=g.user_id)
+    
+    # Date filters: ?upcoming=1, ?from=&to= (overlapping the range), ?month=YYYY-MM
+    start, end = parse_date(request.args.get('from')), parse_date(request.args.get('to'))
+    if request.args.get('month'):
+        start, end = month_range(request.args['month'])
+    if request.args.get('upcoming'):
+        query = query.filter(Trip.start_date >= date.today())
+    if start or end:
+        query = query.filter(*overlapping(Trip, start, end))
+    
+    if request.args.get('upcoming') or start or end:
+        # In travel order, off the (user_id, start_date) index
+        order = [(Trip.start_date, False), (Trip.trip_id, False)]
+    else:
+        order = [(Trip.created_at, True), (Trip.trip_id, True)]
+    trips, next_cursor = paginate(query, order)
+    return jsonify({'trips': [t.to_summary_dict() for t in trips], 'next_cursor': next_cursor})
 
 
 # Shared Trip View
 @app.route('/shared/<share_code>')
 def shared_trip(share_code):
+    # The navbar depends on the visitor, so only anonymous renders are cached
+    anonymous = g.user_id is None
+    if anonymous:
+        # Checked on every hit, so a trip made private or edited elsewhere is never served stale
+        updated_at, = db.session.query(Trip.updated_at).filter_by(
+            share_code=share_code, is_public=True).first_or_404()
+        html = get_page(share_code, page_version(updated_at))
+        if html is not None:
+            return html
+    
     trip = Trip.query.filter_by(share_code=share_code, is_public=True).first_or_404()
-    return render_template('shared_trip.html', trip=trip)
+    html = render_template('shared_trip.html', trip=trip)
+    if anonymous:
+        store_page(share_code, page_version(trip.updated_at), html)
+    return html
 
 
 @app.route('/shared/<share_code>/copy', methods=['POST'])
+@login_required
 def copy_shared_trip(share_code):
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
+    # A single-row insert: the copy shares the original's itinerary blob until either is edited
     original_trip = Trip.query.filter_by(share_code=share_code, is_public=True).first_or_404()
     
     new_trip = Trip(
-        user_id=session['user_id'],
+        user_id=g.user_id,
         trip_name=f"Copy of {original_trip.trip_name}",
         trip_description=original_trip.trip_description,
         trip_category=original_trip.trip_category,
@@ -327,7 +447,8 @@ def copy_shared_trip(share_code):
         start_date=original_trip.start_date,
         end_date=original_trip.end_date,
         total_budget=original_trip.total_budget,
-        itinerary_json=original_trip.itinerary_json
+        itinerary_hash=original_trip.itinerary_hash,
+        summary_json=original_trip.summary_json
     )
     db.session.add(new_trip)
     db.session.commit()
@@ -335,30 +456,37 @@ def copy_shared_trip(share_code):
     return redirect(url_for('itinerary_builder', trip_id=new_trip.trip_id))
 
 
+@app.route('/api/jobs/<job_id>')
+@api_login_required
+def api_job_status(job_id):
+    """Status (and result, once succeeded) of one of the current user's jobs"""
+    job = Job.query.filter_by(job_id=job_id, user_id=g.user_id).first_or_404()
+    return jsonify(job.to_dict())
+
+
 # City Search
 @app.route('/cities')
+@login_required
 def city_search():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    cities = City.query.order_by(City.popular_score.desc()).all()
+    cities, next_cursor = paginate(City.query, [(City.popular_score, True), (City.city_id, True)])
     states = db.session.query(City.state).distinct().order_by(City.state).all()
     states = [s[0] for s in states]
     
-    return render_template('city_search.html', cities=[c.to_dict() for c in cities], states=states)
+    return render_template('city_search.html', cities=[c.to_dict() for c in cities], states=states,
+                           next_cursor=next_cursor)
 
 
 # Activity Search
 @app.route('/activities')
+@login_required
 def activity_search():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    activities = Activity.query.order_by(Activity.rating.desc()).all()
+    activities, next_cursor = paginate(Activity.query_with_city(),
+                                       [(Activity.rating, True), (Activity.activity_id, True)])
     categories = db.session.query(Activity.category).distinct().all()
     categories = [c[0] for c in categories]
     
-    return render_template('activity_search.html', activities=[a.to_dict() for a in activities], categories=categories)
+    return render_template('activity_search.html', activities=[a.to_dict() for a in activities], categories=categories,
+                           next_cursor=next_cursor)
 
 
 # API: Get all cities
@@ -374,27 +502,27 @@ def api_get_cities():
         query = query.filter(City.state == state)
     if category:
         query = query.filter(City.category == category)
+    order = [(City.popular_score, True), (City.city_id, True)]
     if search:
-        query = query.filter(City.name.ilike(f'%{search}%'))
+        query, rank = search_cities(query, search)
+        if rank is not None:
+            order = [(rank, False), (City.city_id, False)]
     
-    cities = query.order_by(City.popular_score.desc()).all()
-    return jsonify({'cities': [c.to_dict() for c in cities]})
+    cities, next_cursor = paginate(query, order)
+    return jsonify({'cities': [c.to_dict() for c in cities], 'next_cursor': next_cursor})
 
 
 # API: Get single city with activities
 @app.route('/api/cities/<city_id>')
 def api_get_city(city_id):
-    city = City.query.get_or_404(city_id)
-    city_data = city.to_dict()
-    city_data['activities'] = [a.to_dict() for a in city.activities]
-    return jsonify(city_data)
+    return snapshot_response(f'city/{city_id}', lambda: build_city_detail(city_id))
 
 
 # API: Get activities for a city
 @app.route('/api/cities/<city_id>/activities')
 def api_get_city_activities(city_id):
-    city = City.query.get_or_404(city_id)
-    activities = Activity.query.filter_by(city_id=city_id).order_by(Activity.rating.desc()).all()
+    City.query.get_or_404(city_id)
+    activities = Activity.query_with_city().filter_by(city_id=city_id).order_by(Activity.rating.desc()).all()
     return jsonify({'activities': [a.to_dict() for a in activities]})
 
 
@@ -407,27 +535,30 @@ def api_get_activities():
     min_cost = request.args.get('min_cost', type=float)
     max_cost = request.args.get('max_cost', type=float)
     
-    query = Activity.query
+    query = Activity.query_with_city()
     
     if city_id:
         query = query.filter(Activity.city_id == city_id)
     if category:
         query = query.filter(Activity.category == category)
+    order = [(Activity.rating, True), (Activity.activity_id, True)]
     if search:
-        query = query.filter(Activity.name.ilike(f'%{search}%'))
+        query, rank = search_activities(query, search)
+        if rank is not None:
+            order = [(rank, False), (Activity.activity_id, False)]
     if min_cost is not None:
         query = query.filter(Activity.estimated_cost >= min_cost)
     if max_cost is not None:
         query = query.filter(Activity.estimated_cost <= max_cost)
     
-    activities = query.order_by(Activity.rating.desc()).all()
-    return jsonify({'activities': [a.to_dict() for a in activities]})
+    activities, next_cursor = paginate(query, order)
+    return jsonify({'activities': [a.to_dict() for a in activities], 'next_cursor': next_cursor})
 
 
 # API: Get single activity
 @app.route('/api/activities/<activity_id>')
 def api_get_activity(activity_id):
-    activity = Activity.query.get_or_404(activity_id)
+    activity = Activity.query_with_city().filter_by(activity_id=activity_id).first_or_404()
     return jsonify(activity.to_dict())
 
 
@@ -438,8 +569,7 @@ def api_search_cities():
     if len(query) < 2:
         return jsonify({'cities': []})
     
-    cities = City.query.filter(City.name.ilike(f'%{query}%')).limit(10).all()
-    return jsonify({'cities': [c.to_dict() for c in cities]})
+    return jsonify({'cities': city_index().complete(query, limit=10)})
 
 
 # API: Search activities by name (for autocomplete)
@@ -448,23 +578,19 @@ def api_search_activities():
     query = request.args.get('q', '').lower()
     city_name = request.args.get('city', '').lower()
     
+    city_id = None
+    if city_name:
+        cities = city_index().complete(city_name, limit=1)
+        if cities:
+            city_id = cities[0]['city_id']
+    
     if len(query) < 1:
-        if city_name:
-            city = City.query.filter(City.name.ilike(f'%{city_name}%')).first()
-            if city:
-                activities = Activity.query.filter_by(city_id=city.city_id).limit(20).all()
-                return jsonify({'activities': [a.to_dict() for a in activities]})
+        if city_id:
+            return jsonify({'activities': activity_index().top(limit=20, group=city_id)})
         return jsonify({'activities': []})
     
-    activities_query = Activity.query.filter(Activity.name.ilike(f'%{query}%'))
-    
-    if city_name:
-        city = City.query.filter(City.name.ilike(f'%{city_name}%')).first()
-        if city:
-            activities_query = activities_query.filter(Activity.city_id == city.city_id)
-    
-    activities = activities_query.limit(10).all()
-    return jsonify({'activities': [a.to_dict() for a in activities]})
+    activities = activity_index().complete(query, limit=10, group=city_id)
+    return jsonify({'activities': activities})
 
 
 # API: Get cities in frontend format (for itinerary builder)
@@ -473,30 +599,18 @@ def api_get_cities_frontend_format():
     """Returns cities in the format expected by the frontend JavaScript:
     { 'CityName': { state: 'State', image: 'url', activities: ['act1', 'act2'] } }
     """
-    cities = City.query.order_by(City.popular_score.desc()).all()
-    
-    result = {}
-    for city in cities:
-        activities = Activity.query.filter_by(city_id=city.city_id).order_by(Activity.rating.desc()).all()
-        result[city.name] = {
-            'state': city.state,
-            'image': city.image_url or '',
-            'category': city.category,
-            'activities': [a.name for a in activities]
-        }
-    
-    return jsonify(result)
+    return snapshot_response('cities_frontend_format', build_cities_frontend_format)
 
 
 # API: Get activities for a city by name (for frontend)
 @app.route('/api/cities/by-name/<city_name>/activities')
 def api_get_activities_by_city_name(city_name):
     """Get activities for a city by its name (case-insensitive)"""
-    city = City.query.filter(City.name.ilike(city_name)).first()
+    city = City.query.filter(db.func.lower(City.name) == city_name.lower()).first()
     if not city:
         return jsonify({'activities': [], 'error': 'City not found'})
     
-    activities = Activity.query.filter_by(city_id=city.city_id).order_by(Activity.rating.desc()).all()
+    activities = Activity.query_with_city().filter_by(city_id=city.city_id).order_by(Activity.rating.desc()).all()
     return jsonify({
         'city': city.to_dict(),
         'activities': [a.to_dict() for a in activities],
@@ -504,38 +618,35 @@ def api_get_activities_by_city_name(city_name):
     })
 
 
+# API: Activities planned most often in a city across all trips
+@app.route('/api/cities/by-name/<city_name>/planned-activities')
+def api_get_planned_activities(city_name):
+    limit = min(page_size(request.args.get('limit', type=int), default=10), 50)
+    rows = most_planned_activities(city_name, limit=limit)
+    return jsonify({'activities': [{'activity_name': name, 'times_planned': count} for name, count in rows]})
+
+
 # API: Get activities in frontend format (for activity_search page)
 @app.route('/api/activities/frontend-format')
 def api_get_activities_frontend_format():
     """Returns activities in the format expected by the frontend JavaScript:
     Array of { name, city, state, type, duration, cost, description }
+
+    With ?limit= or ?cursor= the list is served a page at a time instead:
+    { activities: [...], next_cursor: '...' }
     """
-    activities = Activity.query.join(City).order_by(Activity.rating.desc()).all()
-    
-    result = []
-    for activity in activities:
-        city = City.query.get(activity.city_id)
-        if city:
-            result.append({
-                'name': activity.name,
-                'city': city.name,
-                'state': city.state,
-                'type': activity.category or 'sightseeing',
-                'duration': f"{activity.duration_hours} hours" if activity.duration_hours else '2 hours',
-                'cost': int(activity.estimated_cost) if activity.estimated_cost else 0,
-                'description': activity.description or f"Popular activity in {city.name}"
-            })
-    
-    return jsonify(result)
+    if 'limit' in request.args or 'cursor' in request.args:
+        rows, next_cursor = paginate(activities_frontend_query(),
+                                     [(Activity.rating, True), (Activity.activity_id, True)])
+        return jsonify({'activities': [activity_frontend_format(row) for row in rows], 'next_cursor': next_cursor})
+    return snapshot_response('activities_frontend_format', build_activities_frontend_format)
 
 
 # User Profile
 @app.route('/profile', methods=['GET', 'POST'])
+@login_required
 def profile():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
+    user = current_user()
     
     if request.method == 'POST':
         user.name = request.form.get('name')
@@ -545,17 +656,15 @@ def profile():
         session['user_name'] = user.name
         return redirect(url_for('profile'))
     
-    trips = Trip.query.filter_by(user_id=session['user_id']).all()
-    return render_template('profile.html', user=user, trips=trips)
+    trip_count = db.session.query(db.func.count(Trip.trip_id)).filter(Trip.user_id == g.user_id).scalar()
+    return render_template('profile.html', user=user, trip_count=trip_count)
 
 
 @app.route('/api/profile/update', methods=['POST'])
+@api_login_required
 def update_profile():
     """API endpoint to update user profile"""
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -583,105 +692,46 @@ def update_profile():
 
 
 @app.route('/profile/delete', methods=['POST'])
+@api_login_required
 def delete_account():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    user = User.query.get(session['user_id'])
-    db.session.delete(user)
-    db.session.commit()
+    # Large accounts are deleted by a background job; either way the session ends now
+    job_id = request_user_deletion(g.user_id)
     session.clear()
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'deferred': job_id is not None, 'job_id': job_id})
 
 
 # Analytics
 @app.route('/analytics')
+@login_required
 def analytics():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    
-    user = User.query.get(session['user_id'])
-    trips = Trip.query.filter_by(user_id=session['user_id']).all()
-    
-    # Calculate analytics data
-    total_trips = len(trips)
-    total_budget = sum(t.total_budget for t in trips)
-    
-    # City statistics
-    city_visits = {}
-    activity_types = {}
-    category_count = {}
-    monthly_trips = {}
-    
-    for trip in trips:
-        # Category count
-        cat = trip.trip_category
-        category_count[cat] = category_count.get(cat, 0) + 1
-        
-        # Monthly trips
-        if trip.created_at:
-            month = trip.created_at.strftime('%Y-%m')
-            monthly_trips[month] = monthly_trips.get(month, 0) + 1
-        
-        # Itinerary analysis
-        itinerary = trip.get_itinerary()
-        for stop in itinerary.get('stops', []):
-            city = stop.get('city_name', 'Unknown')
-            city_visits[city] = city_visits.get(city, 0) + 1
-            
-            for day in stop.get('days', []):
-                for activity in day.get('activities', []):
-                    act_type = activity.get('category', 'other')
-                    activity_types[act_type] = activity_types.get(act_type, 0) + 1
-    
-    analytics_data = {
-        'total_trips': total_trips,
-        'total_budget': total_budget,
-        'city_visits': city_visits,
-        'activity_types': activity_types,
-        'category_count': category_count,
-        'monthly_trips': monthly_trips
-    }
-    
-    return render_template('analytics.html', user=user, analytics=analytics_data, trips=[t.to_dict() for t in trips])
+    user = current_user()
+    analytics_data = user_analytics(g.user_id)
+    
+    # The page lists the 5 and charts the 8 most recent trips
+    recent_trips = db.session.query(
+        Trip.trip_id, Trip.trip_name, Trip.trip_category, Trip.start_date, Trip.end_date, Trip.total_budget
+    ).filter(Trip.user_id == g.user_id).order_by(Trip.created_at.desc()).limit(8).all()
+    trips = [dict(row._asdict(), start_date=row.start_date.isoformat(), end_date=row.end_date.isoformat())
+             for row in recent_trips]
+    
+    return render_template('analytics.html', user=user, analytics=analytics_data, trips=trips)
 
 
 # API for analytics data
 @app.route('/api/analytics')
+@api_login_required
 def api_analytics():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    
-    trips = Trip.query.filter_by(user_id=session['user_id']).all()
-    
-    # Same calculations as above
-    city_visits = {}
-    activity_types = {}
-    category_count = {}
-    budget_by_trip = []
-    
-    for trip in trips:
-        cat = trip.trip_category
-        category_count[cat] = category_count.get(cat, 0) + 1
-        budget_by_trip.append({'name': trip.trip_name, 'budget': trip.total_budget})
-        
-        itinerary = trip.get_itinerary()
-        for stop in itinerary.get('stops', []):
-            city = stop.get('city_name', 'Unknown')
-            city_visits[city] = city_visits.get(city, 0) + 1
-            
-            for day in stop.get('days', []):
-                for activity in day.get('activities', []):
-                    act_type = activity.get('category', 'other')
-                    activity_types[act_type] = activity_types.get(act_type, 0) + 1
+    analytics_data = user_analytics(g.user_id)
+    budgets = db.session.query(Trip.trip_name, Trip.total_budget).filter(
+        Trip.user_id == g.user_id).order_by(Trip.created_at.desc()).all()
     
     return jsonify({
-        'total_trips': len(trips),
-        'total_budget': sum(t.total_budget for t in trips),
-        'city_visits': city_visits,
-        'activity_types': activity_types,
-        'category_count': category_count,
-        'budget_by_trip': budget_by_trip
+        'total_trips': analytics_data['total_trips'],
+        'total_budget': analytics_data['total_budget'],
+        'city_visits': analytics_data['city_visits'],
+        'activity_types': analytics_data['activity_types'],
+        'category_count': analytics_data['category_count'],
+        'budget_by_trip': [{'name': name, 'budget': budget} for name, budget in budgets]
     })
 
 
@@ -723,50 +773,51 @@ def admin_logout():
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
-    users = User.query.all()
-    trips = Trip.query.all()
-    cities = City.query.all()
-    activities = Activity.query.all()
-    
-    stats = {
-        'total_users': len(users),
-        'total_trips': len(trips),
-        'total_cities': len(cities),
-        'total_activities': len(activities)
-    }
-    
-    return render_template('admin.html', users=users, trips=trips, cities=cities, activities=activities, stats=stats)
+    # Only the (briefly cached) counts are rendered; the tables load page by page from /admin/api/<table>
+    sorts = {name: list(spec['sorts']) for name, spec in ADMIN_TABLES.items()}
+    return render_template('admin.html', stats=admin_stats(), sorts=sorts)
 
 
 # Admin API Routes
+@app.route('/admin/api/stats')
+@admin_required
+def admin_api_stats():
+    return jsonify(admin_stats())
+
+
+@app.route('/admin/api/<any(users, trips, cities, activities, jobs):table>')
+@admin_required
+def admin_api_table(table):
+    """One page of an admin table: ?sort=&order=asc|desc&q=&cursor=&limit= plus per-table filters"""
+    rows, next_cursor = admin_page(table, request.args, limit=page_size(request.args.get('limit', type=int)))
+    return jsonify({table: rows, 'next_cursor': next_cursor})
+
+
 @app.route('/admin/api/user/<user_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_user(user_id):
-    user = User.query.get_or_404(user_id)
-    # Delete all user's trips first
-    Trip.query.filter_by(user_id=user_id).delete()
-    db.session.delete(user)
-    db.session.commit()
-    return jsonify({'success': True})
+    db.session.query(User.user_id).filter_by(user_id=user_id).first_or_404()
+    job_id = request_user_deletion(user_id)
+    invalidate_admin_stats()
+    return jsonify({'success': True, 'deferred': job_id is not None, 'job_id': job_id})
 
 
 @app.route('/admin/api/trip/<trip_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_trip(trip_id):
-    trip = Trip.query.get_or_404(trip_id)
-    db.session.delete(trip)
-    db.session.commit()
+    if not delete_trips([trip_id]):
+        abort(404)
+    invalidate_admin_stats()
     return jsonify({'success': True})
 
 
 @app.route('/admin/api/city/<city_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_city(city_id):
-    city = City.query.get_or_404(city_id)
-    # Delete all activities in this city first
-    Activity.query.filter_by(city_id=city_id).delete()
-    db.session.delete(city)
-    db.session.commit()
+    # Its activities go with it (ON DELETE CASCADE)
+    if not delete_city(city_id):
+        abort(404)
+    invalidate_admin_stats()
     return jsonify({'success': True})
 
 
@@ -774,42 +825,122 @@ def admin_delete_city(city_id):
 @admin_required
 def admin_delete_activity(activity_id):
     activity = Activity.query.get_or_404(activity_id)
+    City.adjust_activity_count(activity.city_id, -1)
     db.session.delete(activity)
     db.session.commit()
+    invalidate_admin_stats()
+    return jsonify({'success': True})
+
+
+@app.route('/admin/api/itinerary-cache')
+@admin_required
+def admin_itinerary_cache_stats():
+    """Hit/miss counters of this worker's parsed-itinerary cache"""
+    return jsonify(itinerary_cache_stats())
+
+
+@app.route('/admin/api/export/<kind>')
+@admin_required
+def admin_export(kind):
+    """Stream users, trips, cities or activities as ?format=ndjson (default) or csv"""
+    fmt = request.args.get('format', 'ndjson')
+    if kind not in EXPORT_KINDS:
+        return jsonify({'error': f"Unknown export {kind!r}"}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format {fmt!r}"}), 400
+    
+    response = app.response_class(stream_with_context(export_chunks(kind, fmt)), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    return response
+
+
+@app.route('/admin/api/jobs/<job_id>')
+@admin_required
+def admin_job_status(job_id):
+    return jsonify(Job.query.get_or_404(job_id).to_dict())
+
+
+@app.route('/admin/api/jobs/<job_id>/retry', methods=['POST'])
+@admin_required
+def admin_retry_job(job_id):
+    """Requeue a failed job with a fresh set of attempts"""
+    Job.query.get_or_404(job_id)
+    if not retry_job(job_id):
+        return jsonify({'error': 'Only failed jobs can be retried'}), 409
     return jsonify({'success': True})
 
 
+@app.route('/admin/api/jobs/<any(rebuild_analytics, reindex_catalog, export):kind>', methods=['POST'])
+@admin_required
+def admin_enqueue_job(kind):
+    """Queue analytics recomputation ({"user_id"} optional), a search reindex,
+    or a full export ({"kind", "format"}) to download when done"""
+    data = request.get_json(silent=True) or {}
+    if kind == 'export':
+        fmt = data.get('format', 'ndjson')
+        if data.get('kind') not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f"Cannot export {data.get('kind')!r} as {fmt!r}"}), 400
+        payload = {'kind': data['kind'], 'format': fmt, 'file': f'{uuid.uuid4()}.{fmt}'}
+    elif kind == 'rebuild_analytics':
+        payload = {'user_id': data.get('user_id')}
+    else:
+        payload = {}
+    
+    job_id = enqueue(kind, payload)
+    return jsonify({'job_id': job_id, 'status_url': url_for('admin_job_status', job_id=job_id)}), 202
+
+
+@app.route('/admin/api/jobs/<job_id>/download')
+@admin_required
+def admin_download_export(job_id):
+    """The file written by a finished export job"""
+    job = Job.query.filter_by(job_id=job_id, kind='export', status='succeeded').first_or_404()
+    result = job.to_dict()['result']
+    return send_from_directory(app.config['EXPORT_DIR'], result['file'], as_attachment=True,
+                               download_name=f"{result['kind']}.{result['format']}",
+                               mimetype=EXPORT_FORMATS[result['format']])
+
+
 @app.route('/admin/city/add', methods=['POST'])
 @admin_required
 def admin_add_city():
-    import uuid
     city = City(
         city_id=str(uuid.uuid4()),
-        city_name=request.form.get('city_name'),
+        name=request.form.get('city_name'),
         state=request.form.get('state'),
         image_url=request.form.get('image_url', ''),
         description=request.form.get('description', '')
     )
     db.session.add(city)
     db.session.commit()
+    invalidate_admin_stats()
     return redirect(url_for('admin_dashboard'))
 
 
+def parse_duration_hours(value, default=2.0):
+    """Parse a free-form duration like '2 hours' or '1.5' into hours"""
+    try:
+        return float(str(value).split()[0])
+    except (ValueError, IndexError):
+        return default
+
+
 @app.route('/admin/activity/add', methods=['POST'])
 @admin_required
 def admin_add_activity():
-    import uuid
     activity = Activity(
         activity_id=str(uuid.uuid4()),
-        activity_name=request.form.get('activity_name'),
+        name=request.form.get('activity_name'),
         city_id=request.form.get('city_id'),
-        activity_type=request.form.get('activity_type', 'sightseeing'),
-        duration=request.form.get('duration', ''),
-        cost=float(request.form.get('cost', 0)),
+        category=request.form.get('activity_type', 'sightseeing'),
+        duration_hours=parse_duration_hours(request.form.get('duration', '')),
+        estimated_cost=float(request.form.get('cost') or 0),
         description=request.form.get('description', '')
     )
     db.session.add(activity)
+    City.adjust_activity_count(activity.city_id, 1)
     db.session.commit()
+    invalidate_admin_stats()
     return redirect(url_for('admin_dashboard'))
 
 
@@ -817,9 +948,181 @@ def admin_add_activity():
 def init_db():
     with app.app_context():
         db.create_all()
+        applied = upgrade_database()
+        if applied:
+            print(f"Applied migrations: {applied}")
         print("Database initialized!")
 
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Create missing tables and apply pending schema migrations"""
+    init_db()
+
+
+@app.cli.command('db-profile')
+def db_profile_command():
+    """Show the SQLite settings new connections actually get"""
+    with app.app_context(), db.engine.connect() as conn:
+        for pragma, value in sqlite_profile.current_pragmas(conn).items():
+            print(f"{pragma} = {value}")
+
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """Recompute every user's analytics counters from their trips"""
+    with db.engine.begin() as conn:
+        rebuild_user_stats(conn)
+    print("User analytics rebuilt!")
+
+
+@app.cli.command('backfill-itineraries')
+def backfill_itineraries_command():
+    """Rebuild the normalized itinerary tables from every trip's itinerary_json"""
+    with db.engine.begin() as conn:
+        count = backfill_itinerary_rows(conn)
+    print(f"Normalized itineraries rebuilt for {count} trips!")
+
+
+catalog_cli = AppGroup('catalog', help='Catalog (cities and activities) data.')
+trips_cli = AppGroup('trips', help='Trip data.')
+users_cli = AppGroup('users', help='User data.')
+app.cli.add_command(catalog_cli)
+app.cli.add_command(trips_cli)
+app.cli.add_command(users_cli)
+
+jobs_cli = AppGroup('jobs', help='Background jobs.')
+app.cli.add_command(jobs_cli)
+
+
+def run_import_command(importer, source, fmt, batch_size):
+    """Stream `source` through `importer`, printing progress at most once a second"""
+    last_shown = 0.0
+
+    def progress(report):
+        nonlocal last_shown
+        if report['seconds'] - last_shown >= 1:
+            last_shown = report['seconds']
+            click.echo(f"  {report['rows']} rows ({report['rows_per_second']:.0f} rows/s)", err=True)
+
+    rows = bulk_import.read_rows(source, fmt or bulk_import.detect_format(source.name))
+    report = importer(rows, batch_size=batch_size, progress=progress)
+    for error in report['errors']:
+        click.echo(f"  skipped {error}", err=True)
+    click.echo(f"Imported {report['rows']} rows ({report['rejected']} rejected, "
+               f"{report['duplicates']} duplicates) in "
+               f"{report['seconds']:.1f}s, {report['rows_per_second']:.0f} rows/s")
+
+
+def import_options(f):
+    """SOURCE plus the --format/--batch-size options shared by the import commands"""
+    f = click.option('--batch-size', default=bulk_import.DEFAULT_BATCH_SIZE, show_default=True,
+                     help='Rows per transaction.')(f)
+    f = click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+                     help='Input format (default: from the file extension).')(f)
+    return click.argument('source', type=click.File('r', encoding='utf-8'))(f)
+
+
+@catalog_cli.command('import')
+@click.argument('kind', type=click.Choice(['cities', 'activities']))
+@import_options
+def catalog_import_command(kind, source, fmt, batch_size):
+    """Upsert cities or activities from a CSV/NDJSON file ('-' for stdin)"""
+    importer = bulk_import.import_cities if kind == 'cities' else bulk_import.import_activities
+    run_import_command(importer, source, fmt, batch_size)
+
+
+@trips_cli.command('import')
+@import_options
+def trips_import_command(source, fmt, batch_size):
+    """Upsert trips and their itineraries from a CSV/NDJSON file ('-' for stdin)"""
+    run_import_command(bulk_import.import_trips, source, fmt, batch_size)
+
+
+def export_options(f):
+    """OUTPUT plus the --format option shared by the export commands"""
+    f = click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)),
+                     help='Output format (default: csv for .csv files, ndjson otherwise).')(f)
+    return click.argument('output', type=click.File('w', encoding='utf-8'), default='-')(f)
+
+
+def run_export_command(kind, output, fmt):
+    fmt = fmt or ('csv' if output.name.lower().endswith('.csv') else 'ndjson')
+    for chunk in export_chunks(kind, fmt):
+        output.write(chunk)
+
+
+@catalog_cli.command('export')
+@click.argument('kind', type=click.Choice(['cities', 'activities']))
+@export_options
+def catalog_export_command(kind, output, fmt):
+    """Write cities or activities to OUTPUT (stdout by default)"""
+    run_export_command(kind, output, fmt)
+
+
+@trips_cli.command('export')
+@export_options
+def trips_export_command(output, fmt):
+    """Write every trip, with its itinerary, to OUTPUT (stdout by default)"""
+    run_export_command('trips', output, fmt)
+
+
+@users_cli.command('export')
+@export_options
+def users_export_command(output, fmt):
+    """Write every user to OUTPUT (stdout by default)"""
+    run_export_command('users', output, fmt)
+
+
+@jobs_cli.command('worker')
+@click.option('--once', is_flag=True, help='Exit once no job is ready instead of waiting for more.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds between checks of an empty queue.')
+def jobs_worker_command(once, poll_interval):
+    """Claim and run queued jobs until interrupted"""
+    try:
+        count = run_worker(app, poll_interval=poll_interval, once=once)
+    except KeyboardInterrupt:
+        return
+    print(f"Ran {count} jobs")
+
+
+@jobs_cli.command('prune')
+@click.option('--days', default=7, show_default=True, help='Keep jobs that finished more recently than this.')
+def jobs_prune_command(days):
+    """Delete finished jobs older than --days"""
+    with app.app_context():
+        count = prune_jobs(datetime.utcnow() - timedelta(days=days))
+    print(f"Deleted {count} finished jobs")
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if a hot route's queries read a whole table instead of an index"""
+    problems = check_query_plans(app)
+    for url, table, statement in problems:
+        if table is None:
+            print(f"{url}: {statement}")
+        else:
+            print(f"{url}: full scan of {table}\n    {' '.join(statement.split())}")
+    if problems:
+        raise SystemExit(1)
+    print("All query plans use indexes!")
+
+
+@app.cli.command('check-page-scripts')
+def check_page_scripts_command():
+    """Fail if an inline script on a rendered page has a syntax error"""
+    problems = check_page_scripts(app)
+    for url, problem in problems:
+        print(f"{url}: {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("All page scripts parse!")
+
+
 if __name__ == '__main__':
     init_db()
+    # The development server runs its own job worker, in the reloader's serving process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker_thread(app)
     app.run(host='0.0.0.0', debug=True, port=5001)
@@ -0,0 +1,135 @@
+"""
+Payanam - Autocomplete
+In-memory prefix + trigram index for city and activity suggestions
+"""
+
+import heapq
+import unicodedata
+from bisect import bisect_left
+from models import City, Activity
+from catalog import get_snapshot
+
+# Minimum trigram similarity for a fuzzy (typo-tolerant) suggestion
+FUZZY_THRESHOLD = 0.3
+
+
+def normalize(value):
+    """Lowercase and strip accents so 'Kovalam', 'KOVALAM' and 'Kóvalam' compare equal"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold().strip()
+
+
+def trigrams(value):
+    """Padded character trigrams of a normalized string"""
+    padded = f'  {value} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AutocompleteIndex:
+    """Immutable suggestion index over one kind of catalog entry.
+
+    Each entry is (name, score, group, payload): `score` orders suggestions,
+    `group` is an optional key to filter on (an activity's city_id) and
+    `payload` is the ready-to-serialize dict returned to the client.
+
+    Prefix lookups bisect a sorted list of (key, entry) pairs that holds the
+    full name and every word-suffix of it, so 'fort' finds 'Amber Fort'.
+    When prefixes don't fill the requested `limit`, a trigram table supplies
+    close spellings ('jaipor' -> 'Jaipur').
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.keys = []
+        self.grams = {}
+        self.name_grams = []
+        for idx, (name, _score, _group, _payload) in enumerate(entries):
+            normalized = normalize(name)
+            words = normalized.split()
+            for i in range(len(words)):
+                self.keys.append((' '.join(words[i:]), idx))
+            grams = trigrams(normalized)
+            self.name_grams.append(grams)
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(idx)
+        self.keys.sort()
+
+        # Entry indexes best-first, overall and per group, for top()
+        self.ranked = sorted(range(len(entries)), key=self._rank, reverse=True)
+        self.ranked_by_group = {}
+        for idx in self.ranked:
+            self.ranked_by_group.setdefault(entries[idx][2], []).append(idx)
+
+    def _rank(self, idx):
+        # Higher score first; ties keep catalog (insertion) order
+        return (self.entries[idx][1], -idx)
+
+    def _prefix_matches(self, prefix):
+        matches = set()
+        pos = bisect_left(self.keys, (prefix, -1))
+        while pos < len(self.keys) and self.keys[pos][0].startswith(prefix):
+            matches.add(self.keys[pos][1])
+            pos += 1
+        return matches
+
+    def _fuzzy_matches(self, query):
+        query_grams = trigrams(query)
+        overlap = {}
+        for gram in query_grams:
+            for idx in self.grams.get(gram, ()):
+                overlap[idx] = overlap.get(idx, 0) + 1
+        similar = {}
+        for idx, shared in overlap.items():
+            similarity = shared / len(query_grams | self.name_grams[idx])
+            if similarity >= FUZZY_THRESHOLD:
+                similar[idx] = similarity
+        return similar
+
+    def complete(self, query, limit=10, group=None):
+        """Top `limit` payloads for `query`: prefix matches by score, then fuzzy ones"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        allowed = (lambda idx: True) if group is None else (lambda idx: self.entries[idx][2] == group)
+        prefix = [idx for idx in self._prefix_matches(query) if allowed(idx)]
+        best = heapq.nlargest(limit, prefix, key=self._rank)
+
+        if len(best) < limit:
+            seen = set(prefix)
+            fuzzy = [(similarity, idx) for idx, similarity in self._fuzzy_matches(query).items()
+                     if idx not in seen and allowed(idx)]
+            best += [idx for _similarity, idx in heapq.nlargest(
+                limit - len(best), fuzzy, key=lambda item: (item[0], self._rank(item[1]))
+            )]
+
+        return [self.entries[idx][3] for idx in best]
+
+    def top(self, limit=10, group=None):
+        """Highest-scoring payloads, optionally restricted to one group"""
+        ranked = self.ranked if group is None else self.ranked_by_group.get(group, [])
+        return [self.entries[idx][3] for idx in ranked[:limit]]
+
+
+def build_city_index():
+    return AutocompleteIndex([
+        (city.name, city.popular_score or 0, None, city.to_dict())
+        for city in City.query.all()
+    ])
+
+
+def build_activity_index():
+    return AutocompleteIndex([
+        (activity.name, activity.rating or 0, activity.city_id, activity.to_dict())
+        for activity in Activity.query_with_city().all()
+    ])
+
+
+def city_index():
+    """Current city suggestion index, rebuilt after catalog writes"""
+    return get_snapshot('city_autocomplete', build_city_index)['payload']
+
+
+def activity_index():
+    """Current activity suggestion index, rebuilt after catalog writes"""
+    return get_snapshot('activity_autocomplete', build_activity_index)['payload']
@@ -0,0 +1,143 @@
+"""
+Payanam - Bulk Export
+Stream users, trips and the catalog out as NDJSON or CSV in bounded memory
+
+Rows are read through a server-side cursor (yield_per) and serialized in
+chunks as they arrive, so an HTTP client or a CLI pipe starts receiving
+data at once and memory does not grow with the table. The columns match
+what bulk_import.py reads, so an export can be imported elsewhere.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import select
+from models import db, User, Trip, City, Activity, ItineraryBlob
+from jobs import job_handler, job_cleanup, JobError
+
+DEFAULT_BATCH_SIZE = 1000
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+_trips = Trip.__table__
+_blobs = ItineraryBlob.__table__
+
+# kind -> (columns, query); trips carry their parsed itinerary instead of its hash
+_EXPORTS = {
+    'users': (list(User.__table__.c), User.__table__.c.user_id),
+    'cities': (list(City.__table__.c), City.__table__.c.city_id),
+    'activities': (list(Activity.__table__.c), Activity.__table__.c.activity_id),
+    'trips': ([column for column in _trips.c if column.name not in ('itinerary_hash', 'summary_json')],
+              _trips.c.trip_id),
+}
+
+KINDS = tuple(_EXPORTS)
+
+
+def export_columns(kind):
+    """Column names of an export, in output order"""
+    columns = [column.name for column in _EXPORTS[kind][0]]
+    return columns + ['itinerary'] if kind == 'trips' else columns
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def export_rows(kind, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the rows of `kind` as JSON-ready dicts, `batch_size` at a time from the database.
+
+    The whole export reads one snapshot (a single read transaction), so
+    rows written while it runs do not appear half-way through.
+    """
+    columns, order = _EXPORTS[kind]
+    query = select(*columns).order_by(order)
+    if kind == 'trips':
+        query = query.add_columns(_blobs.c.data).outerjoin(
+            _blobs, _blobs.c.content_hash == _trips.c.itinerary_hash)
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(query)
+        for row in result.mappings():
+            data = {column.name: _plain(row[column.name]) for column in columns}
+            if kind == 'trips':
+                text = ItineraryBlob.unpack(row['data']) if row['data'] is not None else None
+                try:
+                    data['itinerary'] = json.loads(text) if text else {'stops': []}
+                except ValueError:
+                    data['itinerary'] = {'stops': []}
+            yield data
+
+
+def ndjson_chunks(rows, chunk_rows=DEFAULT_BATCH_SIZE):
+    """NDJSON text for `rows`, `chunk_rows` lines per chunk"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False) + '\n')
+        if len(lines) >= chunk_rows:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def csv_chunks(rows, columns, chunk_rows=DEFAULT_BATCH_SIZE):
+    """CSV text (header first) for `rows`; nested values are written as JSON"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow({key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                         for key, value in row.items()})
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(kind, fmt, batch_size=DEFAULT_BATCH_SIZE):
+    """Serialized export of `kind` in `fmt` ('ndjson' or 'csv'), as text chunks"""
+    rows = export_rows(kind, batch_size)
+    if fmt == 'csv':
+        return csv_chunks(rows, export_columns(kind), batch_size)
+    return ndjson_chunks(rows, batch_size)
+
+
+def export_path(filename):
+    """Where background exports are written (EXPORT_DIR)"""
+    return os.path.join(current_app.config['EXPORT_DIR'], filename)
+
+
+@job_handler('export')
+def _export_job(payload):
+    """Write an export to EXPORT_DIR/<file>; the file only appears once complete"""
+    kind, fmt, filename = payload.get('kind'), payload.get('format', 'ndjson'), payload.get('file')
+    if kind not in KINDS or fmt not in FORMATS or not filename:
+        raise JobError(f"Cannot export {kind!r} as {fmt!r}")
+    path = export_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w', encoding='utf-8', newline='') as f:
+        for chunk in export_chunks(kind, fmt):
+            f.write(chunk)
+    os.replace(path + '.part', path)
+    return {'kind': kind, 'format': fmt, 'file': filename, 'bytes': os.path.getsize(path)}
+
+
+@job_cleanup('export')
+def _remove_export(payload):
+    """Delete a pruned export job's file, or what a failed attempt left of it"""
+    if not payload.get('file'):
+        return
+    path = export_path(payload['file'])
+    for leftover in (path, path + '.part'):
+        try:
+            os.remove(leftover)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,450 @@
+"""
+Payanam - Bulk Import
+Stream cities, activities and trips from CSV/NDJSON into the database in batches
+
+Rows are read lazily, validated one at a time and written with one
+multi-row upsert per batch, each batch in its own transaction, so memory
+stays flat however large the input is. Invalid rows are skipped and
+reported with their line number. Derived data that the ORM hooks maintain
+for interactive writes (search index, activity counts, itinerary blobs and
+tables, user analytics, cached shared pages) is kept in step per batch.
+"""
+
+import csv
+import json
+import time
+import uuid
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import select, func, bindparam, text
+from sqlalchemy.dialects.sqlite import insert
+from models import db, User, Trip, City, Activity
+from trip_dates import parse_date
+from itinerary_stats import summarize, budget_breakdown
+from itinerary_store import store_blobs, drop_unreferenced_blobs
+from itinerary_tables import write_itinerary_rows
+from analytics import trip_contribution, apply_deltas, accumulate
+from search import search_sync_suspended
+from shared_pages import invalidate_trip_pages
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+    """Raised for an input row that cannot be imported"""
+
+
+# ============== READING ==============
+
+def detect_format(filename):
+    """'ndjson' for .ndjson/.jsonl/.json files, 'csv' otherwise"""
+    return 'ndjson' if str(filename).lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, row dict) from an open text stream, one row at a time"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = RowError(f'invalid JSON ({e})')
+        yield line_number, row if isinstance(row, (dict, RowError)) else RowError('expected a JSON object')
+
+
+def batches(rows, size):
+    """Split an iterable into lists of at most `size` items"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ============== FIELDS ==============
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _text(length=None, required=False, default=''):
+    def convert(value):
+        if _blank(value):
+            if required:
+                raise RowError('is required')
+            return default
+        value = str(value).strip()
+        if length and len(value) > length:
+            raise RowError(f'is longer than {length} characters')
+        return value
+    return convert
+
+
+def _number(kind, default, minimum=None, maximum=None):
+    def convert(value):
+        if _blank(value):
+            return default
+        try:
+            number = kind(value)
+        except (TypeError, ValueError):
+            raise RowError(f'is not a valid {kind.__name__}') from None
+        if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+            raise RowError(f'must be between {minimum} and {maximum}')
+        return number
+    return convert
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    if _blank(value):
+        return False
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'y'):
+        return True
+    if value in ('0', 'false', 'no', 'n'):
+        return False
+    raise RowError('is not a boolean')
+
+
+def _date(value):
+    if _blank(value):
+        raise RowError('is required')
+    try:
+        return parse_date(value)
+    except ValueError as e:
+        raise RowError(str(e)) from None
+
+
+def _timestamp(value):
+    if _blank(value):
+        return datetime.utcnow()
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError('is not an ISO timestamp') from None
+
+
+def _identifier(value):
+    """A 36-character id, or a new UUID when the row has none"""
+    return _text(36)(value) or str(uuid.uuid4())
+
+
+def _itinerary(value):
+    if _blank(value):
+        return {'stops': []}
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise RowError('is not valid JSON') from None
+    if not isinstance(value, dict) or not isinstance(value.get('stops', []), list):
+        raise RowError('must be an object with a "stops" list')
+    return value
+
+
+CITY_FIELDS = {
+    'city_id': _identifier,
+    'name': _text(100, required=True),
+    'state': _text(100, required=True),
+    'description': _text(),
+    'image_url': _text(500),
+    'category': _text(50, default='heritage'),
+    'popular_score': _number(int, 0),
+    'avg_cost_per_day': _number(float, 2000.0, minimum=0),
+    'best_time_to_visit': _text(100),
+    'created_at': _timestamp,
+}
+
+ACTIVITY_FIELDS = {
+    'activity_id': _identifier,
+    'city_id': _text(36, default=None),
+    'name': _text(200, required=True),
+    'description': _text(),
+    'category': _text(50, default='sightseeing'),
+    'estimated_cost': _number(float, 0.0, minimum=0),
+    'duration_hours': _number(float, 2.0, minimum=0),
+    'image_url': _text(500),
+    'rating': _number(float, 4.0, minimum=0, maximum=5),
+    'tips': _text(),
+    'created_at': _timestamp,
+}
+
+TRIP_FIELDS = {
+    'trip_id': _identifier,
+    'user_id': _text(36, required=True),
+    'trip_name': _text(200, required=True),
+    'trip_description': _text(),
+    'trip_category': _text(50, default='leisure'),
+    'cover_image': _text(500),
+    'start_date': _date,
+    'end_date': _date,
+    'total_budget': _number(float, None, minimum=0),
+    'is_public': _flag,
+    'share_code': _text(20, default=None),
+    'created_at': _timestamp,
+}
+
+
+def validate(fields, row):
+    """Convert a raw input row into column values, or raise RowError"""
+    if isinstance(row, RowError):
+        raise row
+    values = {}
+    for column, convert in fields.items():
+        try:
+            values[column] = convert(row.get(column))
+        except RowError as e:
+            raise RowError(f'{column} {e}') from None
+    return values
+
+
+# ============== IMPORT LOOP ==============
+
+def run_import(rows, check, write, batch_size=DEFAULT_BATCH_SIZE, progress=None, key=None):
+    """Validate and write `rows` ((line_number, row) pairs) batch by batch.
+
+    `check(row)` returns the values to write or raises RowError. `write(conn,
+    items, reject)` writes a list of (line_number, values) in one transaction
+    and may call reject(line_number, message) for rows it cannot place.
+    When `key` names the id column, a row whose id appears again later in the
+    same batch is dropped as a duplicate: the last row wins, as it does across
+    batches. `progress(report)` is called after every committed batch.
+
+    Returns a report dict: rows written, rows rejected, duplicates dropped,
+    the first rejection messages, elapsed seconds and rows per second.
+    """
+    report = {'rows': 0, 'rejected': 0, 'duplicates': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+
+    def reject(line_number, message):
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append(f'line {line_number}: {message}')
+
+    for batch in batches(rows, batch_size):
+        items = []
+        for line_number, row in batch:
+            try:
+                items.append((line_number, check(row)))
+            except RowError as e:
+                reject(line_number, str(e))
+        if key:
+            latest = {}
+            for line_number, values in items:
+                latest.pop(values[key], None)
+                latest[values[key]] = (line_number, values)
+            report['duplicates'] += len(items) - len(latest)
+            items = list(latest.values())
+        if items:
+            rejected = report['rejected']
+            with db.engine.begin() as conn:
+                write(conn, items, reject)
+            report['rows'] += len(items) - (report['rejected'] - rejected)
+
+        report['seconds'] = time.perf_counter() - started
+        report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+        if progress:
+            progress(report)
+    return report
+
+
+def _upsert(conn, table, rows, key, keep=()):
+    """INSERT ... ON CONFLICT(key) DO UPDATE every column except `key` and `keep`"""
+    stmt = insert(table)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={name: stmt.excluded[name] for name in rows[0] if name != key and name not in keep}
+    ), rows)
+
+
+def _existing(conn, columns, key, ids):
+    """{id: row} for the rows among `ids` that already exist"""
+    rows = conn.execute(select(*columns).where(key.in_(bindparam('ids', expanding=True))), {'ids': list(ids)})
+    return {row[0]: row for row in rows}
+
+
+# ============== CATALOG ==============
+
+def _write_cities(conn, items, reject):
+    _upsert(conn, City.__table__, [values for _line, values in items], 'city_id', keep=('created_at',))
+
+
+def _refresh_activity_counts(conn, city_ids):
+    if city_ids:
+        conn.execute(text(
+            "UPDATE cities SET activity_count = "
+            "(SELECT COUNT(*) FROM activities WHERE activities.city_id = cities.city_id) "
+            "WHERE city_id IN :ids"
+        ).bindparams(bindparam('ids', expanding=True)), {'ids': list(city_ids)})
+
+
+def _city_ids_by_name(conn, names):
+    """{lowercased name: city_id} for the given city names"""
+    cities = City.__table__
+    rows = conn.execute(select(func.lower(cities.c.name), cities.c.city_id).where(
+        func.lower(cities.c.name).in_(bindparam('names', expanding=True))), {'names': list(names)})
+    return dict(rows.fetchall())
+
+
+def _write_activities(conn, items, reject):
+    cities = City.__table__
+    activities = Activity.__table__
+
+    # Rows may name their city instead of giving its id
+    names = {values['city_name'].lower() for _line, values in items if not values['city_id']}
+    by_name = _city_ids_by_name(conn, names) if names else {}
+    for _line, values in items:
+        if not values['city_id']:
+            values['city_id'] = by_name.get(values['city_name'].lower())
+    known = set(_existing(conn, [cities.c.city_id], cities.c.city_id,
+                          {values['city_id'] for _line, values in items if values['city_id']}))
+
+    rows = []
+    for line_number, values in items:
+        if values['city_id'] not in known:
+            reject(line_number, f"unknown city {values['city_id'] or values['city_name']!r}")
+            continue
+        rows.append({column: values[column] for column in ACTIVITY_FIELDS})
+    if not rows:
+        return
+
+    # Counts of the cities activities move away from change too
+    moved_from = _existing(conn, [activities.c.activity_id, activities.c.city_id], activities.c.activity_id,
+                           [row['activity_id'] for row in rows])
+    _upsert(conn, activities, rows, 'activity_id', keep=('created_at',))
+    _refresh_activity_counts(conn, {row['city_id'] for row in rows} | {row[1] for row in moved_from.values()})
+
+
+def _check_activity(row):
+    values = validate(ACTIVITY_FIELDS, row)
+    values['city_name'] = _text(100)(row.get('city_name'))
+    if not values['city_id'] and not values['city_name']:
+        raise RowError('city_id or city_name is required')
+    return values
+
+
+def import_cities(rows, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Upsert cities by city_id from (line_number, row) pairs"""
+    with search_sync_suspended():
+        report = run_import(rows, lambda row: validate(CITY_FIELDS, row), _write_cities, batch_size, progress,
+                            key='city_id')
+    return report
+
+
+def import_activities(rows, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Upsert activities by activity_id; each row names its city by city_id or city_name"""
+    with search_sync_suspended():
+        report = run_import(rows, _check_activity, _write_activities, batch_size, progress,
+                            key='activity_id')
+    return report
+
+
+# ============== TRIPS ==============
+
+def _check_trip(row):
+    values = validate(TRIP_FIELDS, row)
+    if values['end_date'] < values['start_date']:
+        raise RowError('end_date is before start_date')
+    try:
+        itinerary = _itinerary(row.get('itinerary', row.get('itinerary_json')))
+    except RowError as e:
+        raise RowError(f'itinerary {e}') from None
+    if values['total_budget'] is None:
+        values['total_budget'] = budget_breakdown(itinerary)['total_budget']
+    values['share_code'] = values['share_code'] or str(uuid.uuid4())[:8]
+    values['itinerary_json'] = json.dumps(itinerary)
+    values['summary'] = summarize(itinerary)
+    values['itinerary'] = itinerary
+    return values
+
+
+def _write_trips(conn, items, reject):
+    """Upsert one batch of trips; returns the share codes of replaced public trips"""
+    trips = Trip.__table__
+    users = User.__table__
+
+    known_users = set(_existing(conn, [users.c.user_id], users.c.user_id,
+                                {values['user_id'] for _line, values in items}))
+    previous = _existing(conn, [trips.c.trip_id, trips.c.user_id, trips.c.trip_category, trips.c.total_budget,
+                                trips.c.created_at, trips.c.summary_json, trips.c.share_code, trips.c.is_public],
+                         trips.c.trip_id, [values['trip_id'] for _line, values in items])
+    # Replaced trips keep their share code; a new trip's must not belong to another trip
+    wanted = {values['share_code'] for _line, values in items if values['trip_id'] not in previous}
+    taken = set(conn.execute(select(trips.c.share_code).where(
+        trips.c.share_code.in_(bindparam('codes', expanding=True))), {'codes': list(wanted)}).scalars())
+
+    accepted = []
+    for line_number, values in items:
+        if values['user_id'] not in known_users:
+            reject(line_number, f"unknown user {values['user_id']!r}")
+        elif values['trip_id'] not in previous and values['share_code'] in taken:
+            reject(line_number, f"share_code {values['share_code']!r} is used by another trip")
+        else:
+            if values['trip_id'] not in previous:
+                taken.add(values['share_code'])
+            accepted.append(values)
+    if not accepted:
+        return []
+
+    # Replaced trips: take their old contribution back out of the owner's analytics
+    deltas = {}
+    stale_pages = []
+    for values in accepted:
+        if values['trip_id'] not in previous:
+            continue
+        _trip_id, owner, category, budget, created_at, summary_json, share_code, is_public = previous[values['trip_id']]
+        summary = json.loads(summary_json) if summary_json else summarize({})
+        accumulate(deltas, owner, trip_contribution(category, budget, created_at, summary), -1)
+        if is_public:
+            stale_pages.append(share_code)
+
+    hashes = store_blobs(conn, [values['itinerary_json'] for values in accepted])
+    now = datetime.utcnow()
+    rows = []
+    for values, content_hash in zip(accepted, hashes):
+        rows.append(dict({column: values[column] for column in TRIP_FIELDS}, itinerary_hash=content_hash,
+                         summary_json=json.dumps(values['summary']), itinerary_version=0, updated_at=now))
+        accumulate(deltas, values['user_id'], trip_contribution(
+            values['trip_category'], values['total_budget'], values['created_at'], values['summary']), 1)
+
+    stmt = insert(trips)
+    updated = {name: stmt.excluded[name] for name in rows[0]
+               if name not in ('trip_id', 'share_code', 'created_at', 'itinerary_version')}
+    updated['itinerary_version'] = trips.c.itinerary_version + 1
+    conn.execute(stmt.on_conflict_do_update(index_elements=['trip_id'], set_=updated), rows)
+
+    drop_unreferenced_blobs(conn, set(hashes))
+    write_itinerary_rows(conn, [(values['trip_id'], values['itinerary']) for values in accepted])
+    apply_deltas(conn, deltas)
+    return stale_pages
+
+
+def import_trips(rows, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Upsert trips by trip_id, with their itineraries, from (line_number, row) pairs.
+
+    `itinerary` (an object, or JSON text in CSV files) holds the itinerary;
+    total_budget defaults to the itinerary's activity costs and every row's
+    user_id must belong to an existing user.
+    """
+    stale_pages = []
+
+    def write(conn, items, reject):
+        stale_pages.extend(_write_trips(conn, items, reject))
+
+    def committed(report):
+        # Shared pages of replaced public trips, once the batch is visible
+        invalidate_trip_pages(stale_pages)
+        stale_pages.clear()
+        if progress:
+            progress(report)
+
+    return run_import(rows, _check_trip, write, batch_size, committed, key='trip_id')
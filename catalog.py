@@ -0,0 +1,160 @@
+"""
+Payanam - Catalog Snapshots
+Process-level, versioned snapshots of the city/activity catalog
+"""
+
+from flask import current_app
+from sqlalchemy import literal_column, text
+from models import db, City, Activity
+from http_cache import CATALOG_CACHE_CONTROL, make_etag, conditional_response
+from compression import MIN_SIZE, negotiate, compress, encode_response
+
+# A single-row counter bumped by triggers on every city/activity write, in
+# the writing transaction. Snapshots built against an older version are
+# rebuilt on their next read, in every process: admin routes, imports run
+# from the CLI and the job worker all write through these tables.
+CATALOG_VERSION_DDL = [
+    """CREATE TABLE IF NOT EXISTS catalog_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS {table}_catalog_{op.lower()} AFTER {op} ON {table} BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END"""
+    for table in ('cities', 'activities') for op in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+# name -> {'version': int, 'payload': obj, 'body': bytes, 'etag': str (both set on first response),
+#          'encoded': {encoding: bytes} (filled as clients ask for each encoding)}
+_snapshots = {}
+
+
+def install_catalog_version(conn):
+    for statement in CATALOG_VERSION_DDL:
+        conn.execute(text(statement))
+
+
+def catalog_version():
+    """Return the current catalog version number (a primary-key lookup)"""
+    return db.session.execute(text("SELECT version FROM catalog_version WHERE id = 1")).scalar()
+
+
+def get_snapshot(name, builder):
+    """Return the snapshot entry for `name`, rebuilding it with `builder` if stale.
+
+    The version is read before building, so a write that lands while the
+    payload is being built leaves the entry stale and it is rebuilt next time.
+    """
+    version = catalog_version()
+    entry = _snapshots.get(name)
+    if entry is not None and entry['version'] == version:
+        return entry
+
+    payload = builder()
+    entry = {'version': version, 'payload': payload}
+    _snapshots[name] = entry
+    return entry
+
+
+def snapshot_response(name, builder):
+    """Serve a snapshot as a JSON response without re-serializing it.
+
+    The ETag is a hash of the serialized body, so it stays valid across
+    worker processes and a client revalidating gets a 304 after only the
+    version lookup.
+    Compressed bodies are also kept on the entry, so each version is
+    compressed at most once per encoding.
+    """
+    entry = get_snapshot(name, builder)
+    if 'body' not in entry:
+        body = current_app.json.response(entry['payload']).get_data()
+        entry['etag'] = make_etag(body.decode('utf-8'))
+        entry['encoded'] = {}
+        entry['body'] = body
+    response = conditional_response(
+        entry['etag'],
+        lambda: current_app.response_class(entry['body'], mimetype='application/json'),
+        CATALOG_CACHE_CONTROL
+    )
+
+    encoding = negotiate()
+    if response.status_code == 200 and encoding and len(entry['body']) >= MIN_SIZE:
+        if encoding not in entry['encoded']:
+            entry['encoded'][encoding] = compress(entry['body'], encoding, static=True)
+        encode_response(response, encoding, entry['encoded'][encoding])
+    return response
+
+
+def build_city_detail(city_id):
+    """A city with its activities, as served by /api/cities/<city_id>"""
+    city = db.get_or_404(City, city_id)
+    city_data = city.to_dict()
+    city_data['activities'] = [a.to_dict() for a in city.activities]
+    return city_data
+
+
+def build_cities_frontend_format():
+    """Build the { 'CityName': { state, image, category, activities } } map
+    with a single City/Activity outer join instead of one query per city.
+
+    Ties on rating fall back to insertion order (rowid), which is the
+    curated order the catalog was seeded in.
+    """
+    rows = db.session.query(
+        City.city_id, City.name, City.state, City.image_url, City.category, Activity.name
+    ).outerjoin(Activity, Activity.city_id == City.city_id).order_by(
+        City.popular_score.desc(), literal_column('cities.rowid'),
+        Activity.rating.desc(), literal_column('activities.rowid')
+    ).all()
+
+    result = {}
+    current_city_id = None
+    current = None
+    for city_id, name, state, image_url, category, activity_name in rows:
+        if city_id != current_city_id:
+            current_city_id = city_id
+            current = {
+                'state': state,
+                'image': image_url or '',
+                'category': category,
+                'activities': []
+            }
+            result[name] = current
+        if activity_name is not None:
+            current['activities'].append(activity_name)
+
+    return result
+
+
+def activities_frontend_query():
+    """Projected Activity/City join with the columns of the frontend format"""
+    return db.session.query(
+        Activity.name, City.name, City.state, Activity.category,
+        Activity.duration_hours, Activity.estimated_cost, Activity.description
+    ).join(City, Activity.city_id == City.city_id)
+
+
+def activity_frontend_format(row):
+    """One { name, city, state, type, duration, cost, description } item"""
+    name, city_name, state, category, duration_hours, estimated_cost, description = row
+    return {
+        'name': name,
+        'city': city_name,
+        'state': state,
+        'type': category or 'sightseeing',
+        'duration': f"{duration_hours} hours" if duration_hours else '2 hours',
+        'cost': int(estimated_cost) if estimated_cost else 0,
+        'description': description or f"Popular activity in {city_name}"
+    }
+
+
+def build_activities_frontend_format():
+    """Build the [ { name, city, state, type, duration, cost, description } ]
+    list from a single projected Activity/City join.
+    """
+    rows = activities_frontend_query().order_by(
+        Activity.rating.desc(), literal_column('activities.rowid')
+    ).all()
+    return [activity_frontend_format(row) for row in rows]
@@ -0,0 +1,72 @@
+"""
+Payanam - Response Compression
+gzip/brotli content negotiation for text responses
+"""
+
+import gzip
+from flask import request
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript')
+
+# Below this size the encoding overhead outweighs the savings
+MIN_SIZE = 500
+
+# Fast settings for per-request compression; cached payloads are compressed
+# once, so they get the smallest output instead.
+DYNAMIC_LEVEL = {'br': 5, 'gzip': 6}
+STATIC_LEVEL = {'br': 11, 'gzip': 9}
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate():
+    """The best encoding the client accepts, or None for identity"""
+    accepted = request.accept_encodings
+    best = None
+    best_quality = 0
+    for encoding in available_encodings():
+        quality = accepted.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, static=False):
+    level = (STATIC_LEVEL if static else DYNAMIC_LEVEL)[encoding]
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output (and so its ETag) identical across workers
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def encode_response(response, encoding, data):
+    """Install an already-compressed body on `response`"""
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag:
+        # Each encoding is a different representation with its own validator
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def compress_response(response):
+    """after_request hook: compress eligible responses for clients that accept it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_SIZE:
+        return response
+    return encode_response(response, encoding, compress(data, encoding))
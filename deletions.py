@@ -0,0 +1,117 @@
+"""
+Payanam - Deletions
+Set-based deletes of users, trips and cities, backed by ON DELETE CASCADE
+
+Nothing is loaded into the ORM session. Deleting a user cascades to their
+trips and analytics counters, deleting a trip cascades to its normalized
+itinerary rows (the trips triggers release its itinerary blob), and
+deleting a city cascades to its activities (the FTS triggers drop them
+from search and the catalog version triggers retire cached snapshots).
+What the database cannot do itself - other users' analytics counters,
+cached shared pages - is handled here.
+"""
+
+import json
+import os
+from datetime import datetime
+from sqlalchemy import select
+from models import db, User, Trip, City
+from analytics import accumulate, apply_deltas, trip_contribution
+from itinerary_stats import summarize
+from shared_pages import invalidate_trip_pages
+from jobs import job_handler, enqueue
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_INLINE_TRIPS = 500
+
+_trips = Trip.__table__
+_users = User.__table__
+_cities = City.__table__
+
+
+def _delete_trip_rows(conn, trip_ids):
+    """DELETE the given trips, taking them out of their owners' analytics;
+    returns (trips deleted, their share codes)"""
+    rows = conn.execute(select(
+        _trips.c.user_id, _trips.c.trip_category, _trips.c.total_budget, _trips.c.created_at,
+        _trips.c.summary_json, _trips.c.share_code
+    ).where(_trips.c.trip_id.in_(trip_ids))).fetchall()
+
+    deltas = {}
+    for owner, category, budget, created_at, summary_json, _share_code in rows:
+        summary = json.loads(summary_json) if summary_json else summarize({})
+        accumulate(deltas, owner, trip_contribution(category, budget, created_at, summary), -1)
+    conn.execute(_trips.delete().where(_trips.c.trip_id.in_(trip_ids)))
+    apply_deltas(conn, deltas)
+    return len(rows), [row.share_code for row in rows if row.share_code]
+
+
+def delete_trips(trip_ids):
+    """Delete trips by id in one transaction; returns how many existed"""
+    trip_ids = list(trip_ids)
+    if not trip_ids:
+        return 0
+    with db.engine.begin() as conn:
+        removed, share_codes = _delete_trip_rows(conn, trip_ids)
+    invalidate_trip_pages(share_codes)
+    return removed
+
+
+def delete_user(user_id, batch_size=None):
+    """Delete a user and everything they own; returns whether the user existed.
+
+    Without `batch_size` this is a single DELETE on users that cascades to
+    the trips. With it, trips go first, `batch_size` per transaction, so a
+    very large account never holds the write lock for long; analytics stay
+    consistent at every commit if the run is interrupted.
+    """
+    if batch_size:
+        while True:
+            with db.engine.begin() as conn:
+                trip_ids = conn.execute(select(_trips.c.trip_id).where(
+                    _trips.c.user_id == user_id).limit(batch_size)).scalars().all()
+                share_codes = _delete_trip_rows(conn, trip_ids)[1] if trip_ids else []
+            invalidate_trip_pages(share_codes)
+            if len(trip_ids) < batch_size:
+                break
+
+    with db.engine.begin() as conn:
+        share_codes = conn.execute(select(_trips.c.share_code).where(
+            _trips.c.user_id == user_id, _trips.c.share_code.isnot(None))).scalars().all()
+        found = conn.execute(_users.delete().where(_users.c.user_id == user_id)).rowcount > 0
+    invalidate_trip_pages(share_codes)
+    return found
+
+
+def delete_city(city_id):
+    """Delete a city and (by cascade) its activities; returns whether it existed"""
+    with db.engine.begin() as conn:
+        return conn.execute(_cities.delete().where(_cities.c.city_id == city_id)).rowcount > 0
+
+
+def owns_many_trips(user_id, limit=None):
+    """Whether a user owns more than `limit` (DELETE_INLINE_TRIPS) trips; counts at most limit + 1 rows"""
+    limit = limit if limit is not None else int(os.getenv('DELETE_INLINE_TRIPS', DEFAULT_INLINE_TRIPS))
+    owned = select(_trips.c.trip_id).where(_trips.c.user_id == user_id).limit(limit + 1).subquery()
+    return db.session.execute(select(db.func.count()).select_from(owned)).scalar() > limit
+
+
+@job_handler('delete_user')
+def _delete_user_job(payload):
+    return {'deleted': delete_user(payload['user_id'], batch_size=DEFAULT_BATCH_SIZE)}
+
+
+def request_user_deletion(user_id):
+    """Delete a user now, or queue a background job if they own many trips.
+
+    Returns the job_id of a deferred deletion, else None. A deferred
+    account is deactivated first, so it cannot log in again while it
+    waits for a worker. Until the job has run the account is partly
+    deleted but consistent, and the job can safely run again after a crash.
+    """
+    if not owns_many_trips(user_id):
+        delete_user(user_id)
+        return None
+    with db.engine.begin() as conn:
+        conn.execute(_users.update().where(_users.c.user_id == user_id).values(deactivated_at=datetime.utcnow()))
+    return enqueue('delete_user', {'user_id': user_id}, user_id=user_id)
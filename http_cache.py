@@ -0,0 +1,47 @@
+"""
+Payanam - HTTP Caching
+Strong ETags, conditional GETs and per-route Cache-Control policies
+"""
+
+import hashlib
+from flask import current_app, request
+
+# The catalog changes only through the admin panel; a minute of staleness
+# is fine and revalidation afterwards is a cheap 304.
+CATALOG_CACHE_CONTROL = 'public, max-age=60'
+
+# Itineraries change under the user's own hands, so browsers must always
+# revalidate, and shared caches must never keep them.
+ITINERARY_CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts):
+    """Opaque strong ETag value for the given version components"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _held_variant(etag):
+    """The variant of `etag` the client sent in If-None-Match, if any.
+    Compressed responses carry the ETag with an encoding suffix."""
+    for suffix in ('', '-gzip', '-br'):
+        if request.if_none_match.contains_weak(etag + suffix):
+            return etag + suffix
+    return None
+
+
+def conditional_response(etag, build, cache_control):
+    """Answer 304 if the client already holds `etag`, otherwise call `build()`.
+
+    The ETag is checked before `build` runs, so a matching request skips
+    both the query and the serialization behind it.
+    """
+    held = _held_variant(etag)
+    if held:
+        response = current_app.response_class(status=304)
+        response.set_etag(held)
+        response.vary.add('Accept-Encoding')
+    else:
+        response = build()
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
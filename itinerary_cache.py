@@ -0,0 +1,86 @@
+"""
+Payanam - Parsed Itinerary Cache
+Per-process LRU of parsed, read-only itineraries keyed by content hash
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+def max_entries():
+    # Read on use: app.py loads .env after this module is imported
+    return int(os.getenv('ITINERARY_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+class FrozenDict(dict):
+    """A dict that refuses to change. Still a dict, so it serializes and
+    renders like one; callers that need to edit use Trip.get_itinerary()."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Cached itineraries are read-only; use Trip.get_itinerary() for a mutable copy')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return json.loads(json.dumps(self))
+
+
+def freeze(value):
+    """Recursively turn dicts into FrozenDicts and lists into tuples"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def parse(itinerary_json):
+    try:
+        return json.loads(itinerary_json)
+    except (TypeError, ValueError):
+        return {"stops": []}
+
+
+def cached_itinerary(key, load_json):
+    """The frozen itinerary stored under content hash `key`.
+
+    `load_json` is only called on a miss, so the itinerary blob is not
+    read when the parsed copy is already cached.
+    """
+    with _lock:
+        itinerary = _entries.get(key)
+        if itinerary is not None:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return itinerary
+        _stats['misses'] += 1
+
+    itinerary = freeze(parse(load_json()))
+    with _lock:
+        _entries[key] = itinerary
+        limit = max_entries()
+        while len(_entries) > limit:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+    return itinerary
+
+
+def cache_stats():
+    """Hit/miss counters for sizing ITINERARY_CACHE_SIZE"""
+    with _lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return dict(_stats, size=len(_entries), max_size=max_entries(),
+                    hit_rate=_stats['hits'] / lookups if lookups else 0.0)
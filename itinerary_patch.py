@@ -0,0 +1,117 @@
+"""
+Payanam - Itinerary Patches
+Apply RFC 6902 (JSON Patch) operations to an itinerary document
+"""
+
+import copy
+
+
+class PatchError(ValueError):
+    """Raised when a patch is malformed or does not apply to the document"""
+
+
+def parse_pointer(pointer):
+    """Split an RFC 6901 JSON pointer ('/stops/0/days') into reference tokens"""
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise PatchError(f'Invalid JSON pointer: {pointer!r}')
+    if pointer == '':
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    # isascii(): str.isdigit() also accepts digits like '²' that int() rejects
+    if not (token.isascii() and token.isdigit()) or (token != '0' and token.startswith('0')):
+        raise PatchError(f'Invalid array index: {token!r}')
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise PatchError(f'Array index out of range: {index}')
+    return index
+
+
+def _resolve(doc, tokens):
+    """Walk `tokens` from `doc` and return the value they point to"""
+    node = doc
+    for token in tokens:
+        if isinstance(node, list):
+            node = node[_array_index(node, token)]
+        elif isinstance(node, dict):
+            if token not in node:
+                raise PatchError(f'Path not found: /{"/".join(tokens)}')
+            node = node[token]
+        else:
+            raise PatchError(f'Path not found: /{"/".join(tokens)}')
+    return node
+
+
+def _parent(doc, tokens):
+    if not tokens:
+        raise PatchError('Operation cannot target the document root')
+    parent = _resolve(doc, tokens[:-1])
+    if not isinstance(parent, (list, dict)):
+        raise PatchError(f'Path not found: /{"/".join(tokens)}')
+    return parent, tokens[-1]
+
+
+def _add(doc, tokens, value):
+    parent, key = _parent(doc, tokens)
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, key, allow_end=True), value)
+    else:
+        parent[key] = value
+
+
+def _remove(doc, tokens):
+    parent, key = _parent(doc, tokens)
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, key))
+    if key not in parent:
+        raise PatchError(f'Path not found: /{"/".join(tokens)}')
+    return parent.pop(key)
+
+
+def apply_patch(doc, operations):
+    """Apply `operations` to `doc` in place and return it.
+
+    If an operation fails a PatchError is raised and `doc` may be left
+    half-patched, so callers should pass a freshly parsed copy and only
+    store the result on success.
+    """
+    if not isinstance(operations, list):
+        raise PatchError('A patch must be a list of operations')
+
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PatchError('Each operation must be an object')
+        op = operation.get('op')
+        tokens = parse_pointer(operation.get('path'))
+
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"'{op}' requires a value")
+
+        if op == 'add':
+            _add(doc, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(doc, tokens)
+        elif op == 'replace':
+            _remove(doc, tokens)
+            _add(doc, tokens, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            source = parse_pointer(operation.get('from'))
+            if op == 'move':
+                if tokens[:len(source)] == source and tokens != source:
+                    raise PatchError('Cannot move a value into one of its children')
+                value = _remove(doc, source)
+            else:
+                value = copy.deepcopy(_resolve(doc, source))
+            _add(doc, tokens, value)
+        elif op == 'test':
+            if _resolve(doc, tokens) != operation['value']:
+                raise PatchError(f'Test failed at {operation["path"]}')
+        else:
+            raise PatchError(f'Unsupported operation: {op!r}')
+
+    return doc
@@ -0,0 +1,97 @@
+"""
+Payanam - Itinerary Statistics
+Server-side budget and summary figures derived from an itinerary dict
+"""
+
+import re
+
+_LEADING_NUMBER = re.compile(r'\s*[-+]?(\d+(\.\d*)?|\.\d+)')
+
+
+def parse_cost(value):
+    """Read a cost the way the builder's parseFloat(...) || 0 does"""
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _LEADING_NUMBER.match(str(value or ''))
+    return float(match.group(0)) if match else 0.0
+
+
+def children(node, key):
+    """The dict items of node[key], skipping anything malformed"""
+    items = node.get(key) if isinstance(node, dict) else None
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+def budget_breakdown(itinerary):
+    """Total activity cost of an itinerary with per-stop, per-day and per-category subtotals"""
+    by_stop = []
+    by_day = []
+    by_category = {}
+    total = 0.0
+
+    for stop_index, stop in enumerate(children(itinerary, 'stops')):
+        stop_total = 0.0
+        for day in children(stop, 'days'):
+            day_total = 0.0
+            for activity in children(day, 'activities'):
+                cost = parse_cost(activity.get('estimated_cost'))
+                category = activity.get('category') or 'other'
+                by_category[category] = by_category.get(category, 0.0) + cost
+                day_total += cost
+            by_day.append({
+                'stop_index': stop_index,
+                'day_number': day.get('day_number'),
+                'date': day.get('date'),
+                'total': day_total
+            })
+            stop_total += day_total
+        by_stop.append({
+            'stop_index': stop_index,
+            'city_name': stop.get('city_name'),
+            'total': stop_total
+        })
+        total += stop_total
+
+    return {
+        'total_budget': total,
+        'by_stop': by_stop,
+        'by_day': by_day,
+        'by_category': by_category
+    }
+
+
+def summarize(itinerary):
+    """Per-trip summary stored alongside the itinerary: sizes, city visits,
+    activity types and total cost. Feeds the incremental user analytics.
+    """
+    city_visits = {}
+    activity_types = {}
+    days = 0
+    activities = 0
+    total_cost = 0.0
+
+    stops = children(itinerary, 'stops')
+    for stop in stops:
+        city = stop.get('city_name', 'Unknown')
+        city_visits[city] = city_visits.get(city, 0) + 1
+        for day in children(stop, 'days'):
+            days += 1
+            for activity in children(day, 'activities'):
+                activities += 1
+                act_type = activity.get('category', 'other')
+                activity_types[act_type] = activity_types.get(act_type, 0) + 1
+                total_cost += parse_cost(activity.get('estimated_cost'))
+
+    return {
+        'stops': len(stops),
+        'days': days,
+        'activities': activities,
+        'cities': len(city_visits),
+        'total_cost': total_cost,
+        'city_visits': city_visits,
+        'activity_types': activity_types
+    }
@@ -0,0 +1,133 @@
+"""
+Payanam - Itinerary Storage
+Content-addressed, compressed itinerary bodies shared between trips
+
+Trip.itinerary_hash points at an itinerary_blobs row. Blobs are written at
+flush time, and triggers on trips keep each blob's ref_count in step and
+delete a blob when its last trip lets go of it.
+"""
+
+from sqlalchemy import event, inspect, text, bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert
+from models import Trip, ItineraryBlob, EMPTY_ITINERARY
+
+BLOB_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trips_blob_insert AFTER INSERT ON trips
+    WHEN new.itinerary_hash IS NOT NULL BEGIN
+        UPDATE itinerary_blobs SET ref_count = ref_count + 1 WHERE content_hash = new.itinerary_hash;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trips_blob_delete AFTER DELETE ON trips
+    WHEN old.itinerary_hash IS NOT NULL BEGIN
+        UPDATE itinerary_blobs SET ref_count = ref_count - 1 WHERE content_hash = old.itinerary_hash;
+        DELETE FROM itinerary_blobs WHERE content_hash = old.itinerary_hash AND ref_count <= 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trips_blob_update AFTER UPDATE OF itinerary_hash ON trips
+    WHEN old.itinerary_hash IS NOT new.itinerary_hash BEGIN
+        UPDATE itinerary_blobs SET ref_count = ref_count + 1 WHERE content_hash = new.itinerary_hash;
+        UPDATE itinerary_blobs SET ref_count = ref_count - 1 WHERE content_hash = old.itinerary_hash;
+        DELETE FROM itinerary_blobs WHERE content_hash = old.itinerary_hash AND ref_count <= 0;
+    END""",
+]
+
+
+def install_blob_triggers(conn):
+    for statement in BLOB_TRIGGERS:
+        conn.execute(text(statement))
+
+
+def store_blob(conn, itinerary_json):
+    """Make sure a blob for `itinerary_json` exists and return its hash.
+    New blobs start unreferenced; the trips triggers count references."""
+    return store_blobs(conn, [itinerary_json])[0]
+
+
+def store_blobs(conn, itinerary_jsons):
+    """store_blob() for many itineraries in one statement; returns their hashes in order"""
+    hashes = [ItineraryBlob.hash_text(itinerary_json) for itinerary_json in itinerary_jsons]
+    rows = {
+        content_hash: {
+            'content_hash': content_hash,
+            'data': ItineraryBlob.pack(itinerary_json),
+            'size': len(itinerary_json.encode('utf-8')),
+            'ref_count': 0
+        }
+        for content_hash, itinerary_json in zip(hashes, itinerary_jsons)
+    }
+    if rows:
+        conn.execute(insert(ItineraryBlob.__table__).on_conflict_do_nothing(), list(rows.values()))
+    return hashes
+
+
+def drop_unreferenced_blobs(conn, content_hashes):
+    """Delete blobs among `content_hashes` that no trip ended up pointing at"""
+    if content_hashes:
+        conn.execute(text(
+            "DELETE FROM itinerary_blobs WHERE content_hash IN :hashes AND ref_count <= 0 "
+            "AND NOT EXISTS (SELECT 1 FROM trips WHERE trips.itinerary_hash = itinerary_blobs.content_hash)"
+        ).bindparams(bindparam('hashes', expanding=True)), {'hashes': list(content_hashes)})
+
+
+@event.listens_for(Session, 'before_flush')
+def _write_itinerary_blobs(session, flush_context, instances):
+    """Write the blobs of itineraries assigned since the last flush, before
+    the trip rows that reference them"""
+    written = session.info.setdefault('written_itinerary_blobs', set())
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Trip):
+            continue
+        if obj.itinerary_hash is None:
+            obj.itinerary_json = EMPTY_ITINERARY
+        if not inspect(obj).attrs.itinerary_hash.history.added:
+            continue
+        loaded = getattr(obj, '_itinerary_text', None)
+        if loaded is not None and loaded[0] == obj.itinerary_hash:
+            # Hashes copied from another trip already have their blob
+            written.add(store_blob(session.connection(), loaded[1]))
+
+
+@event.listens_for(Session, 'after_flush')
+def _drop_orphaned_blobs(session, flush_context):
+    """A blob written for an itinerary that was replaced again before the
+    flush is referenced by nothing"""
+    drop_unreferenced_blobs(session.connection(), session.info.pop('written_itinerary_blobs', None))
+
+
+def trip_itinerary_texts(conn, trip_ids):
+    """{trip_id: itinerary JSON text or None} read on a plain connection.
+
+    Works before and after the blob migration: rows still carrying the
+    legacy trips.itinerary_json column are read from it.
+    """
+    if not trip_ids:
+        return {}
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(trips)"))}
+    select_blob = "itinerary_blobs.data" if 'itinerary_hash' in columns else "NULL"
+    select_legacy = "trips.itinerary_json" if 'itinerary_json' in columns else "NULL"
+    join = ("LEFT JOIN itinerary_blobs ON itinerary_blobs.content_hash = trips.itinerary_hash"
+            if 'itinerary_hash' in columns else "")
+
+    rows = conn.execute(text(
+        f"SELECT trips.trip_id, {select_blob}, {select_legacy} FROM trips {join} WHERE trips.trip_id IN :ids"
+    ).bindparams(bindparam('ids', expanding=True)), {'ids': list(trip_ids)})
+    return {
+        trip_id: ItineraryBlob.unpack(data) if data is not None else legacy
+        for trip_id, data, legacy in rows
+    }
+
+
+def move_legacy_itineraries(conn, batch_size=500):
+    """Move trips.itinerary_json bodies into itinerary_blobs, batch by batch"""
+    count = 0
+    while True:
+        batch = conn.execute(text(
+            "SELECT trip_id, itinerary_json FROM trips WHERE itinerary_hash IS NULL LIMIT :limit"
+        ), {'limit': batch_size}).fetchall()
+        if not batch:
+            return count
+        for trip_id, itinerary_json in batch:
+            content_hash = store_blob(conn, itinerary_json or EMPTY_ITINERARY)
+            conn.execute(text(
+                "UPDATE trips SET itinerary_hash = :hash, itinerary_json = NULL WHERE trip_id = :trip_id"
+            ), {'hash': content_hash, 'trip_id': trip_id})
+        count += len(batch)
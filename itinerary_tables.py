@@ -0,0 +1,155 @@
+"""
+Payanam - Normalized Itineraries
+trip_stops / trip_days / trip_activity_entries rows mirrored from Trip.itinerary_json
+
+itinerary_json stays the source of truth; these tables are rewritten in the
+same transaction whenever it changes so cross-trip questions can be answered
+in SQL instead of by parsing every itinerary in Python.
+"""
+
+import json
+from sqlalchemy import event, inspect, select, func
+from sqlalchemy.orm import Session
+from models import db, Trip, TripStop, TripDay, TripActivityEntry
+from itinerary_stats import children, parse_cost
+from itinerary_store import trip_itinerary_texts
+from trip_dates import DateError, parse_date
+
+NORMALIZED_TABLES = (TripActivityEntry.__table__, TripDay.__table__, TripStop.__table__)
+
+
+def _date(value):
+    """An itinerary date parsed like the trip dates; None if it is missing or
+    not a date, as the itinerary JSON holds whatever the builder sent"""
+    try:
+        return parse_date(value)
+    except DateError:
+        return None
+
+
+def _text(value, length):
+    return str(value)[:length] if value is not None else None
+
+
+def itinerary_rows(trip_id, itinerary):
+    """Flatten an itinerary dict into (stops, days, entries) row dicts"""
+    stops, days, entries = [], [], []
+    for stop_position, stop in enumerate(children(itinerary, 'stops')):
+        city_name = _text(stop.get('city_name'), 100)
+        stops.append({
+            'trip_id': trip_id,
+            'position': stop_position,
+            'city_name': city_name,
+            'state': _text(stop.get('state'), 100),
+            'arrival_date': _date(stop.get('arrival_date')),
+            'departure_date': _date(stop.get('departure_date'))
+        })
+        for day_position, day in enumerate(children(stop, 'days')):
+            day_date = _date(day.get('date'))
+            day_number = day.get('day_number')
+            days.append({
+                'trip_id': trip_id,
+                'stop_position': stop_position,
+                'position': day_position,
+                'day_number': day_number if isinstance(day_number, int) else None,
+                'date': day_date,
+                'city_name': city_name
+            })
+            for position, activity in enumerate(children(day, 'activities')):
+                entries.append({
+                    'trip_id': trip_id,
+                    'stop_position': stop_position,
+                    'day_position': day_position,
+                    'position': position,
+                    'activity_name': _text(activity.get('activity_name') or activity.get('name'), 200),
+                    'category': _text(activity.get('category'), 50),
+                    'estimated_cost': parse_cost(activity.get('estimated_cost')),
+                    'time': _text(activity.get('time'), 20),
+                    'date': day_date,
+                    'city_name': city_name
+                })
+    return stops, days, entries
+
+
+def delete_itinerary_rows(conn, trip_ids):
+    for table in NORMALIZED_TABLES:
+        conn.execute(table.delete().where(table.c.trip_id.in_(trip_ids)))
+
+
+def write_itinerary_rows(conn, trips):
+    """Replace the normalized rows of each (trip_id, itinerary) pair"""
+    trips = list(trips)
+    if not trips:
+        return
+    delete_itinerary_rows(conn, [trip_id for trip_id, _itinerary in trips])
+
+    stops, days, entries = [], [], []
+    for trip_id, itinerary in trips:
+        trip_stops, trip_days, trip_entries = itinerary_rows(trip_id, itinerary)
+        stops += trip_stops
+        days += trip_days
+        entries += trip_entries
+    for table, rows in ((TripStop.__table__, stops), (TripDay.__table__, days),
+                        (TripActivityEntry.__table__, entries)):
+        if rows:
+            conn.execute(table.insert(), rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_itinerary_rows(session, flush_context):
+    """Mirror itinerary_json changes of this flush into the normalized tables"""
+    changed = []
+    removed = []
+    for obj in session.new:
+        if isinstance(obj, Trip):
+            changed.append((obj.trip_id, obj.get_itinerary()))
+    for obj in session.dirty:
+        if isinstance(obj, Trip) and inspect(obj).attrs.itinerary_hash.history.has_changes():
+            changed.append((obj.trip_id, obj.get_itinerary()))
+    for obj in session.deleted:
+        if isinstance(obj, Trip):
+            removed.append(obj.trip_id)
+
+    if changed or removed:
+        conn = session.connection()
+        if removed:
+            delete_itinerary_rows(conn, removed)
+        write_itinerary_rows(conn, changed)
+
+
+def backfill_itinerary_rows(conn, batch_size=500):
+    """Rebuild the normalized rows of every trip, `batch_size` trips at a time"""
+    trips = Trip.__table__
+    for table in NORMALIZED_TABLES:
+        conn.execute(table.delete())
+
+    last_id = ''
+    count = 0
+    while True:
+        batch = conn.execute(
+            select(trips.c.trip_id).where(trips.c.trip_id > last_id).order_by(trips.c.trip_id).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            return count
+        texts = trip_itinerary_texts(conn, batch)
+        parsed = []
+        for trip_id in batch:
+            try:
+                parsed.append((trip_id, json.loads(texts.get(trip_id))))
+            except (TypeError, ValueError):
+                parsed.append((trip_id, {}))
+        write_itinerary_rows(conn, parsed)
+        count += len(batch)
+        last_id = batch[-1]
+
+
+# ============== QUERIES ==============
+
+def most_planned_activities(city_name, limit=10):
+    """Activities planned most often in a city (matched case-insensitively, like
+    the other by-name routes), across all trips"""
+    count = func.count().label('times_planned')
+    return db.session.query(TripActivityEntry.activity_name, count).filter(
+        func.lower(TripActivityEntry.city_name) == city_name.lower(), TripActivityEntry.activity_name.isnot(None)
+    ).group_by(TripActivityEntry.activity_name).order_by(count.desc(), TripActivityEntry.activity_name).limit(limit).all()
+
@@ -0,0 +1,194 @@
+"""
+Payanam - Background Jobs
+A job queue kept in the SQLite database, with retries and a worker loop
+
+Request handlers enqueue() a job and return at once; `flask --app app jobs
+worker` (or the thread the development server starts) claims ready jobs
+one at a time and runs the handler registered for their kind. A job is
+claimed with an UPDATE ... WHERE status = 'queued', so any number of worker
+processes can share the queue: a worker that loses the race for a job
+moves on to the next one. A failed job is retried with exponential backoff until
+it runs out of attempts; a job whose worker died is requeued once its
+lock times out. Handlers may therefore run more than once and must be
+idempotent.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, case
+from models import db, Job
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 30     # seconds before the first retry; doubles after each failure
+DEFAULT_LOCK_TIMEOUT = 3600  # seconds before a running job is presumed abandoned
+DEFAULT_POLL_INTERVAL = 1.0
+
+_jobs = Job.__table__
+
+# kind -> handler(payload) returning a JSON-serializable result
+JOB_HANDLERS = {}
+# kind -> cleanup(payload) removing what a job left outside the database, run when it is pruned
+JOB_CLEANUPS = {}
+
+
+class JobError(Exception):
+    """Raised by a handler for a failure that retrying cannot fix"""
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler of `kind` jobs"""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def job_cleanup(kind):
+    """Register the decorated function to run for each pruned `kind` job"""
+    def register(cleanup):
+        JOB_CLEANUPS[kind] = cleanup
+        return cleanup
+    return register
+
+
+def enqueue(kind, payload=None, user_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Queue a job and commit it at once; returns its job_id"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"No handler for job kind {kind!r}")
+    job_id = str(uuid.uuid4())
+    with db.engine.begin() as conn:
+        conn.execute(_jobs.insert().values(
+            job_id=job_id, kind=kind, payload_json=json.dumps(payload or {}), user_id=user_id,
+            max_attempts=max_attempts
+        ))
+    return job_id
+
+
+def _requeue_abandoned(conn, now):
+    """Give jobs whose worker stopped answering back to the queue (or fail them
+    if that was their last attempt)"""
+    timeout = int(os.getenv('JOB_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    exhausted = _jobs.c.attempts >= _jobs.c.max_attempts
+    conn.execute(update(_jobs).where(
+        _jobs.c.status == 'running', _jobs.c.locked_at < now - timedelta(seconds=timeout)
+    ).values(
+        status=case((exhausted, 'failed'), else_='queued'),
+        error='Worker stopped before the job finished',
+        finished_at=case((exhausted, now), else_=None),
+        locked_by=None, locked_at=None
+    ))
+
+
+def claim_job(worker):
+    """Mark the oldest ready job as running for `worker` and return it
+    as (job_id, kind, payload_json, attempts, max_attempts), or None"""
+    now = datetime.utcnow()
+    ready = select(_jobs.c.job_id).where(
+        _jobs.c.status == 'queued', _jobs.c.run_after <= now
+    ).order_by(_jobs.c.run_after).limit(1)
+    with db.engine.begin() as conn:
+        _requeue_abandoned(conn, now)
+        while True:
+            job_id = conn.execute(ready).scalar()
+            if job_id is None:
+                return None
+            # Only one worker's UPDATE still finds the job queued
+            claimed = conn.execute(update(_jobs).where(_jobs.c.job_id == job_id, _jobs.c.status == 'queued').values(
+                status='running', attempts=_jobs.c.attempts + 1, locked_by=worker, locked_at=now
+            )).rowcount
+            if claimed:
+                return conn.execute(select(_jobs.c.job_id, _jobs.c.kind, _jobs.c.payload_json, _jobs.c.attempts,
+                                           _jobs.c.max_attempts).where(_jobs.c.job_id == job_id)).first()
+
+
+def _finish(job_id, **values):
+    with db.engine.begin() as conn:
+        conn.execute(update(_jobs).where(_jobs.c.job_id == job_id).values(locked_by=None, locked_at=None, **values))
+
+
+def run_job(job_id, kind, payload_json, attempts, max_attempts):
+    """Run a claimed job and record its outcome; returns the new status"""
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise JobError(f"No handler for job kind {kind!r}")
+        result = handler(json.loads(payload_json))
+    except Exception as e:
+        db.session.rollback()
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        if isinstance(e, JobError) or attempts >= max_attempts:
+            _finish(job_id, status='failed', error=error, finished_at=datetime.utcnow())
+            return 'failed'
+        delay = int(os.getenv('JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY)) * 2 ** (attempts - 1)
+        _finish(job_id, status='queued', error=error, run_after=datetime.utcnow() + timedelta(seconds=delay))
+        return 'queued'
+    finally:
+        db.session.remove()
+
+    _finish(job_id, status='succeeded', error=None, result_json=json.dumps(result),
+            finished_at=datetime.utcnow())
+    return 'succeeded'
+
+
+def run_next_job(worker):
+    """Claim and run one job; returns its final status, or None if nothing was ready"""
+    job = claim_job(worker)
+    return run_job(*job) if job is not None else None
+
+
+def run_worker(app, worker=None, poll_interval=DEFAULT_POLL_INTERVAL, once=False, stop=None):
+    """Run jobs until `stop` (a threading.Event) is set, or, with `once`,
+    until no job is ready. Returns the number of jobs run."""
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    count = 0
+    while stop is None or not stop.is_set():
+        with app.app_context():
+            status = run_next_job(worker)
+        if status is not None:
+            count += 1
+            app.logger.info('Job run by %s: %s', worker, status)
+            continue
+        if once:
+            break
+        if stop is not None:
+            stop.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+    return count
+
+
+def start_worker_thread(app, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Run a worker on a daemon thread of this process (development server)"""
+    stop = threading.Event()
+    thread = threading.Thread(target=run_worker, args=(app,), kwargs={'poll_interval': poll_interval, 'stop': stop},
+                              name='payanam-jobs', daemon=True)
+    thread.start()
+    return stop
+
+
+def retry_job(job_id):
+    """Put a failed job back in the queue with a fresh set of attempts; returns whether it was failed"""
+    with db.engine.begin() as conn:
+        return conn.execute(update(_jobs).where(_jobs.c.job_id == job_id, _jobs.c.status == 'failed').values(
+            status='queued', attempts=0, run_after=datetime.utcnow(), finished_at=None
+        )).rowcount > 0
+
+
+def prune_jobs(older_than):
+    """Delete jobs that finished before `older_than` (a datetime), with anything
+    their kind's cleanup removes (export files); returns how many"""
+    finished = (_jobs.c.status.in_(('succeeded', 'failed')), _jobs.c.finished_at < older_than)
+    with db.engine.begin() as conn:
+        pruned = conn.execute(select(_jobs.c.kind, _jobs.c.payload_json).where(*finished)).all()
+        conn.execute(_jobs.delete().where(*finished))
+    # Only after the rows are gone, so no download is offered for a removed file
+    for kind, payload_json in pruned:
+        if kind in JOB_CLEANUPS:
+            JOB_CLEANUPS[kind](json.loads(payload_json))
+    return len(pruned)
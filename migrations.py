@@ -0,0 +1,286 @@
+"""
+Payanam - Schema Migrations
+Small, ordered SQLite migrations tracked with PRAGMA user_version
+"""
+
+import json
+import sqlite3
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+from models import db, User, UserStat, Trip, TripActivityEntry, City, Activity, Job
+from search import fts5_available, install_search_index, search_index_installed
+from analytics import rebuild_user_stats
+from itinerary_stats import summarize
+from itinerary_tables import backfill_itinerary_rows
+from itinerary_store import install_blob_triggers, move_legacy_itineraries, trip_itinerary_texts
+from catalog import install_catalog_version
+
+
+def column_exists(conn, table, column):
+    """Check whether `table` already has `column` (create_all may have added it)"""
+    rows = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there"""
+    if not column_exists(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def missing_cascades(conn, model):
+    """(column, parent table) of the model's ON DELETE CASCADE keys the database lacks"""
+    declared = {(fk.parent.name, fk.column.table.name) for fk in model.__table__.foreign_keys
+                if fk.ondelete == 'CASCADE'}
+    actual = {(row[3], row[2]) for row in conn.execute(text(f"PRAGMA foreign_key_list({model.__tablename__})"))
+              if row[6] == 'CASCADE'}
+    return declared - actual
+
+
+def missing_not_null(conn, model):
+    """Names of the model's NOT NULL columns the database still allows NULL in"""
+    declared = {column.name for column in model.__table__.columns if not column.nullable}
+    nullable = {row[1] for row in conn.execute(text(f"PRAGMA table_info({model.__tablename__})"))
+                if not row[3] and not row[5]}
+    return declared & nullable
+
+
+def rebuild_table(conn, model):
+    """Recreate a model's table from its current definition, keeping its rows.
+
+    SQLite cannot change constraints in place. Run with foreign_keys off
+    (as upgrade() does) so dropping the old table cascades nowhere; the
+    table's indexes and triggers go with it and must be recreated.
+    """
+    name = model.__tablename__
+    existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({name})"))}
+    columns = ', '.join(f'"{column.name}"' for column in model.__table__.columns if column.name in existing)
+    ddl = str(CreateTable(model.__table__).compile(dialect=conn.dialect)).strip()
+    conn.execute(text(ddl.replace(f'CREATE TABLE {name} ', f'CREATE TABLE _new_{name} ', 1)))
+    conn.execute(text(f"INSERT INTO _new_{name} ({columns}) SELECT {columns} FROM {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text(f"ALTER TABLE _new_{name} RENAME TO {name}"))
+
+
+def _iso_date(value, fallback):
+    """`value` as 'YYYY-MM-DD', trying the formats dates were entered in"""
+    value = str(value or '').strip()
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%Y/%m/%d'):
+        try:
+            return datetime.strptime(value[:10], fmt).date().isoformat()
+        except ValueError:
+            continue
+    return fallback
+
+
+# ============== MIGRATIONS ==============
+
+def _001_city_activity_count(conn):
+    """Denormalized activity count on cities, backfilled from activities"""
+    add_column(conn, 'cities', 'activity_count', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute(text(
+        "UPDATE cities SET activity_count = "
+        "(SELECT COUNT(*) FROM activities WHERE activities.city_id = cities.city_id)"
+    ))
+
+
+def _002_catalog_search_index(conn):
+    """FTS5 index over cities and activities plus the triggers that sync it"""
+    if fts5_available(conn):
+        install_search_index(conn)
+
+
+def _003_trip_itinerary_version(conn):
+    """Version counter used for optimistic itinerary patches"""
+    add_column(conn, 'trips', 'itinerary_version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _004_trip_summaries_and_user_stats(conn):
+    """Stored per-trip itinerary summaries and the per-user counters built from them"""
+    add_column(conn, 'trips', 'summary_json', 'TEXT')
+    trip_ids = conn.execute(text("SELECT trip_id FROM trips WHERE summary_json IS NULL")).scalars().all()
+    texts = trip_itinerary_texts(conn, trip_ids)
+    for trip_id in trip_ids:
+        try:
+            itinerary = json.loads(texts.get(trip_id))
+        except (TypeError, ValueError):
+            itinerary = {}
+        conn.execute(text("UPDATE trips SET summary_json = :summary WHERE trip_id = :trip_id"),
+                     {'summary': json.dumps(summarize(itinerary)), 'trip_id': trip_id})
+    # user_stats itself is created by db.create_all()
+    rebuild_user_stats(conn)
+
+
+def _005_normalized_itineraries(conn):
+    """Fill trip_stops/trip_days/trip_activity_entries (created by db.create_all())"""
+    backfill_itinerary_rows(conn)
+
+
+def _006_itinerary_blobs(conn):
+    """Move itinerary bodies into content-addressed, compressed itinerary_blobs
+    (created by db.create_all()) and drop the old trips.itinerary_json column"""
+    add_column(conn, 'trips', 'itinerary_hash', 'VARCHAR(64) REFERENCES itinerary_blobs (content_hash)')
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_trips_itinerary_hash ON trips (itinerary_hash)"))
+    install_blob_triggers(conn)
+    if column_exists(conn, 'trips', 'itinerary_json'):
+        move_legacy_itineraries(conn)
+        # DROP COLUMN needs SQLite 3.35; older builds keep the emptied column.
+        # Run VACUUM afterwards to hand the freed pages back to the filesystem.
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            conn.execute(text("ALTER TABLE trips DROP COLUMN itinerary_json"))
+
+
+def create_missing_indexes(conn, *models):
+    """Create the indexes declared in each model's __table_args__ that the database lacks"""
+    existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    for model in models:
+        for index in model.__table__.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def _007_hot_path_indexes(conn):
+    """Composite indexes matching the filter/order of the list and dashboard
+    routes (declared in each model's __table_args__)"""
+    create_missing_indexes(conn, Trip, City, Activity)
+
+
+def _008_trip_date_columns(conn):
+    """trips.start_date/end_date become Date columns.
+
+    SQLite stores SQLAlchemy Dates as 'YYYY-MM-DD' text, the format the
+    date inputs already posted, so the columns keep their storage and only
+    values in any other format are rewritten. Dates that cannot be read
+    fall back to the day the trip was created.
+    """
+    rows = conn.execute(text("SELECT trip_id, start_date, end_date, created_at FROM trips")).fetchall()
+    for trip_id, start_date, end_date, created_at in rows:
+        fallback = str(created_at or '')[:10] or date.today().isoformat()
+        values = {'start_date': _iso_date(start_date, fallback), 'end_date': _iso_date(end_date, fallback)}
+        if (values['start_date'], values['end_date']) != (start_date, end_date):
+            conn.execute(text(
+                "UPDATE trips SET start_date = :start_date, end_date = :end_date WHERE trip_id = :trip_id"
+            ), dict(values, trip_id=trip_id))
+    _007_hot_path_indexes(conn)
+
+
+def _009_admin_listing_indexes(conn):
+    """(created_at, pk) indexes for the admin panel's default newest-first
+    user and trip listings"""
+    create_missing_indexes(conn, User, Trip)
+
+
+def _010_cascading_foreign_keys(conn):
+    """ON DELETE CASCADE from users to trips and user_stats and from cities
+    to activities, so deletes are single set-based statements"""
+    rebuilt = [model for model in (Trip, UserStat, Activity) if missing_cascades(conn, model)]
+    for model in rebuilt:
+        rebuild_table(conn, model)
+    create_missing_indexes(conn, *rebuilt)
+    if Trip in rebuilt:
+        install_blob_triggers(conn)
+    if Activity in rebuilt and search_index_installed(conn):
+        install_search_index(conn)
+
+
+def _011_catalog_version(conn):
+    """A database-wide catalog version counter, bumped by triggers on cities and
+    activities, so every process notices catalog writes made by any other"""
+    install_catalog_version(conn)
+
+
+def _012_user_deactivated_at(conn):
+    """users.deactivated_at, set while a background job deletes the account"""
+    add_column(conn, 'users', 'deactivated_at', 'DATETIME')
+
+
+def _013_case_insensitive_city_activity_index(conn):
+    """Index trip_activity_entries on lower(city_name), which city lookups now
+    compare, in place of the case-sensitive city_name index"""
+    conn.execute(text("DROP INDEX IF EXISTS ix_trip_activity_entries_city_activity"))
+    create_missing_indexes(conn, TripActivityEntry)
+
+
+# Values for NULL sort keys: each sorts where SQLite put the NULL before (last
+# in the newest-first and highest-first listings)
+SORT_KEY_BACKFILL = {
+    'created_at': '1970-01-01 00:00:00.000000',
+    'total_budget': 0,
+    'popular_score': 0,
+    'estimated_cost': 0,
+    'rating': 0,
+}
+
+
+def _014_not_null_sort_keys(conn):
+    """Make the keyset pagination sort keys NOT NULL; a NULL key compares as
+    neither before nor after a cursor, so its row dropped out of later pages"""
+    rebuilt = []
+    for model in (User, Trip, City, Activity, Job):
+        columns = missing_not_null(conn, model) & SORT_KEY_BACKFILL.keys()
+        if not columns:
+            continue
+        for column in sorted(columns):
+            conn.execute(text(f"UPDATE {model.__tablename__} SET {column} = :value WHERE {column} IS NULL"),
+                         {'value': SORT_KEY_BACKFILL[column]})
+        rebuild_table(conn, model)
+        rebuilt.append(model)
+    create_missing_indexes(conn, *rebuilt)
+    if Trip in rebuilt:
+        install_blob_triggers(conn)
+    if (City in rebuilt or Activity in rebuilt) and search_index_installed(conn):
+        install_search_index(conn)
+    if City in rebuilt or Activity in rebuilt:
+        install_catalog_version(conn)
+
+
+# Ordered list of (version, migration); never renumber or reorder entries
+MIGRATIONS = [
+    (1, _001_city_activity_count),
+    (2, _002_catalog_search_index),
+    (3, _003_trip_itinerary_version),
+    (4, _004_trip_summaries_and_user_stats),
+    (5, _005_normalized_itineraries),
+    (6, _006_itinerary_blobs),
+    (7, _007_hot_path_indexes),
+    (8, _008_trip_date_columns),
+    (9, _009_admin_listing_indexes),
+    (10, _010_cascading_foreign_keys),
+    (11, _011_catalog_version),
+    (12, _012_user_deactivated_at),
+    (13, _013_case_insensitive_city_activity_index),
+    (14, _014_not_null_sort_keys),
+]
+
+
+def current_version(conn):
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def upgrade():
+    """Apply every migration newer than the database's user_version.
+
+    Must run inside an app context, after db.create_all(). Migrations are
+    idempotent, and user_version is only bumped once a migration succeeds.
+    They run with foreign key enforcement off, which SQLite only lets a
+    connection change outside a transaction, so table rebuilds do not
+    cascade into child tables.
+    """
+    applied = []
+    with db.engine.connect() as conn:
+        conn.execute(text("PRAGMA foreign_keys = OFF"))
+        conn.commit()
+        try:
+            for version, migration in MIGRATIONS:
+                with conn.begin():
+                    if current_version(conn) >= version:
+                        continue
+                    migration(conn)
+                    conn.execute(text(f"PRAGMA user_version = {version}"))
+                    applied.append(version)
+        finally:
+            conn.rollback()
+            conn.execute(text("PRAGMA foreign_keys = ON"))
+            conn.commit()
+    return applied
@@ -4,9 +4,15 @@ All SQLAlchemy models for the application
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, defer, validates
 from datetime import datetime
 import uuid
 import json
+import hashlib
+import zlib
+from itinerary_stats import summarize
+from itinerary_cache import cached_itinerary, freeze
+from trip_dates import parse_date
 
 db = SQLAlchemy()
 
@@ -20,10 +26,17 @@ class User(db.Model):
     email = db.Column(db.String(150), unique=True, nullable=False)
     avatar_url = db.Column(db.String(500), default='')
     language_pref = db.Column(db.String(10), default='en')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    deactivated_at = db.Column(db.DateTime)  # Set while a background job deletes the account; blocks login
     
     # Relationships
-    trips = db.relationship('Trip', backref='owner', lazy=True, cascade='all, delete-orphan')
+    # passive_deletes: the database's ON DELETE CASCADE removes them, without loading them first
+    trips = db.relationship('Trip', backref='owner', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        # Admin user listing, newest first
+        db.Index('ix_users_created', 'created_at', 'user_id'),
+    )
 
     def to_dict(self):
         return {
@@ -36,26 +49,114 @@ class User(db.Model):
         }
 
 
+class UserStat(db.Model):
+    """One per-user analytics counter (e.g. city_visits/Jaipur = 3),
+    maintained incrementally by analytics.py as trips change"""
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.String(36), db.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    metric = db.Column(db.String(30), primary_key=True)  # total_trips, total_budget, city_visits, activity_types, category_count, monthly_trips
+    key = db.Column(db.String(200), primary_key=True, default='')
+    value = db.Column(db.Float, nullable=False, default=0.0)
+
+
+EMPTY_ITINERARY = '{"stops": []}'
+
+
+class ItineraryBlob(db.Model):
+    """A zlib-compressed itinerary body, stored once per distinct content
+    and shared by every trip with that content (e.g. copies of a shared trip).
+    ref_count is maintained by triggers on trips (see itinerary_store.py)."""
+    __tablename__ = 'itinerary_blobs'
+
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the JSON text
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # Uncompressed length in bytes
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def pack(text):
+        return zlib.compress(text.encode('utf-8'), 6)
+
+    @staticmethod
+    def unpack(data):
+        return zlib.decompress(data).decode('utf-8')
+
+    @staticmethod
+    def load_text(content_hash):
+        """The itinerary text stored under `content_hash`, or None"""
+        data = db.session.execute(
+            db.select(ItineraryBlob.data).where(ItineraryBlob.content_hash == content_hash)
+        ).scalar()
+        return ItineraryBlob.unpack(data) if data is not None else None
+
+
 class Trip(db.Model):
     """Trip model for storing trip information and itinerary"""
     __tablename__ = 'trips'
     
     trip_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.user_id'), nullable=False)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
     trip_name = db.Column(db.String(200), nullable=False)
     trip_description = db.Column(db.Text, default='')
     trip_category = db.Column(db.String(50), default='leisure')
     cover_image = db.Column(db.String(500), default='')
-    start_date = db.Column(db.String(20), nullable=False)
-    end_date = db.Column(db.String(20), nullable=False)
-    total_budget = db.Column(db.Float, default=0.0)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    total_budget = db.Column(db.Float, default=0.0, nullable=False)
     is_public = db.Column(db.Boolean, default=False)
     share_code = db.Column(db.String(20), unique=True, default=lambda: str(uuid.uuid4())[:8])
-    itinerary_json = db.Column(db.Text, default='{"stops": []}')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    itinerary_hash = db.Column(db.String(64), db.ForeignKey('itinerary_blobs.content_hash'), index=True)
+    itinerary_version = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every itinerary save
+    summary_json = db.Column(db.Text)  # itinerary_stats.summarize() of the itinerary
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def to_dict(self):
+    __table_args__ = (
+        # A user's trips, newest first (dashboard, my trips, /api/trips pages)
+        db.Index('ix_trips_user_created', 'user_id', 'created_at', 'trip_id'),
+        # Upcoming / overlapping / by-month listings, in date order
+        db.Index('ix_trips_user_start', 'user_id', 'start_date', 'trip_id'),
+        # Admin trip listing across all users, newest first
+        db.Index('ix_trips_created', 'created_at', 'trip_id'),
+    )
+
+    @validates('start_date', 'end_date')
+    def _parse_date(self, key, value):
+        # Forms and JSON bodies send 'YYYY-MM-DD' strings
+        return parse_date(value)
+
+    @classmethod
+    def summary_query(cls):
+        """Trip query for listings. Itinerary bodies live in itinerary_blobs
+        and are only read when itinerary_json is accessed."""
+        return cls.query
+
+    @property
+    def itinerary_json(self):
+        """The itinerary JSON text, read from its content-addressed blob"""
+        loaded = getattr(self, '_itinerary_text', None)
+        if loaded is not None and loaded[0] == self.itinerary_hash:
+            return loaded[1]
+        text = None
+        if self.itinerary_hash is not None:
+            text = ItineraryBlob.load_text(self.itinerary_hash)
+        text = text if text is not None else EMPTY_ITINERARY
+        self._itinerary_text = (self.itinerary_hash, text)
+        return text
+
+    @itinerary_json.setter
+    def itinerary_json(self, text):
+        # The blob itself is written at flush time (itinerary_store.py)
+        content_hash = ItineraryBlob.hash_text(text)
+        self._itinerary_text = (content_hash, text)
+        self.itinerary_hash = content_hash
+
+    def _fields(self):
         return {
             'trip_id': self.trip_id,
             'user_id': self.user_id,
@@ -63,26 +164,126 @@ class Trip(db.Model):
             'trip_description': self.trip_description,
             'trip_category': self.trip_category,
             'cover_image': self.cover_image,
-            'start_date': self.start_date,
-            'end_date': self.end_date,
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
             'total_budget': self.total_budget,
             'is_public': self.is_public,
             'share_code': self.share_code,
-            'itinerary_json': self.itinerary_json,
+            'itinerary_version': self.itinerary_version,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+    def to_dict(self):
+        data = self._fields()
+        data['itinerary_json'] = self.itinerary_json
+        return data
+
+    def to_summary_dict(self):
+        """Trip fields plus itinerary counts, without the itinerary itself"""
+        data = self._fields()
+        summary = self.get_summary()
+        for key in ('stops', 'days', 'activities', 'cities'):
+            data[key] = summary.get(key, 0)
+        return data
+
     def get_itinerary(self):
-        """Parse and return the itinerary JSON"""
+        """Parse and return the itinerary JSON as a fresh, mutable dict"""
         try:
             return json.loads(self.itinerary_json)
         except:
             return {"stops": []}
 
+    def read_itinerary(self):
+        """Return the itinerary read-only, from the parsed-itinerary cache.
+        Entries are keyed by content hash, so copies share one parsed copy."""
+        if self.itinerary_hash is None:
+            return freeze(self.get_itinerary())
+        return cached_itinerary(self.itinerary_hash, lambda: self.itinerary_json)
+
     def set_itinerary(self, itinerary):
-        """Set the itinerary from a dict"""
+        """Set the itinerary from a dict, bump its version and refresh its summary"""
         self.itinerary_json = json.dumps(itinerary)
+        self.itinerary_version = (self.itinerary_version or 0) + 1
+        self.summary_json = json.dumps(summarize(itinerary))
+
+    def claim_itinerary_version(self, base):
+        """Take the next itinerary version if the stored one is still `base`;
+        returns whether it was. Call before set_itinerary().
+
+        A conditional UPDATE in the session's transaction, so SQLite's write
+        lock is held from here until the commit: of two saves from the same
+        base, the second finds the version moved on and gets no row.
+        """
+        trips = Trip.__table__
+        claimed = db.session.execute(trips.update().where(
+            trips.c.trip_id == self.trip_id, trips.c.itinerary_version == base
+        ).values(itinerary_version=base + 1)).rowcount == 1
+        if claimed:
+            self.itinerary_version = base
+        return claimed
+
+    def get_summary(self):
+        """Return the stored itinerary summary, computing it if missing"""
+        if self.summary_json:
+            return json.loads(self.summary_json)
+        return summarize(self.get_itinerary())
+
+
+class TripStop(db.Model):
+    """One stop of a trip's itinerary, mirrored from itinerary_json for SQL queries"""
+    __tablename__ = 'trip_stops'
+
+    trip_id = db.Column(db.String(36), db.ForeignKey('trips.trip_id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # Index in itinerary['stops']
+    city_name = db.Column(db.String(100))
+    state = db.Column(db.String(100))
+    arrival_date = db.Column(db.Date)
+    departure_date = db.Column(db.Date)
+
+    __table_args__ = (
+        db.Index('ix_trip_stops_city_arrival', 'city_name', 'arrival_date'),
+        db.Index('ix_trip_stops_arrival', 'arrival_date'),
+    )
+
+
+class TripDay(db.Model):
+    """One day of a trip stop, mirrored from itinerary_json"""
+    __tablename__ = 'trip_days'
+
+    trip_id = db.Column(db.String(36), db.ForeignKey('trips.trip_id', ondelete='CASCADE'), primary_key=True)
+    stop_position = db.Column(db.Integer, primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # Index in stop['days']
+    day_number = db.Column(db.Integer)
+    date = db.Column(db.Date)
+    city_name = db.Column(db.String(100))
+
+    __table_args__ = (
+        db.Index('ix_trip_days_date', 'date'),
+        db.Index('ix_trip_days_city_date', 'city_name', 'date'),
+    )
+
+
+class TripActivityEntry(db.Model):
+    """One planned activity on a trip day, mirrored from itinerary_json"""
+    __tablename__ = 'trip_activity_entries'
+
+    trip_id = db.Column(db.String(36), db.ForeignKey('trips.trip_id', ondelete='CASCADE'), primary_key=True)
+    stop_position = db.Column(db.Integer, primary_key=True)
+    day_position = db.Column(db.Integer, primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # Index in day['activities']
+    activity_name = db.Column(db.String(200))
+    category = db.Column(db.String(50))
+    estimated_cost = db.Column(db.Float, default=0.0)
+    time = db.Column(db.String(20))
+    date = db.Column(db.Date)
+    city_name = db.Column(db.String(100))
+
+    __table_args__ = (
+        # Case-insensitive city lookups (most planned activities per city)
+        db.Index('ix_trip_activity_entries_city_lower', db.func.lower(city_name), activity_name),
+        db.Index('ix_trip_activity_entries_date', 'date'),
+    )
 
 
 class City(db.Model):
@@ -95,13 +296,21 @@ class City(db.Model):
     description = db.Column(db.Text, default='')
     image_url = db.Column(db.String(500), default='')
     category = db.Column(db.String(50), default='heritage')  # heritage, beach, hill-station, pilgrimage, nature, adventure
-    popular_score = db.Column(db.Integer, default=0)  # Higher = more popular
+    popular_score = db.Column(db.Integer, default=0, nullable=False)  # Higher = more popular
     avg_cost_per_day = db.Column(db.Float, default=2000.0)  # Average cost in INR
     best_time_to_visit = db.Column(db.String(100), default='')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    activity_count = db.Column(db.Integer, nullable=False, default=0)  # Denormalized len(activities)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
-    activities = db.relationship('Activity', backref='city', lazy=True, cascade='all, delete-orphan')
+    activities = db.relationship('Activity', backref='city', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_cities_popular', 'popular_score', 'city_id'),
+        db.Index('ix_cities_state_popular', 'state', 'popular_score'),
+        db.Index('ix_cities_category_popular', 'category', 'popular_score'),
+        db.Index('ix_cities_name_lower', db.func.lower(name)),  # Case-insensitive lookups by name
+    )
 
     def to_dict(self):
         return {
@@ -114,25 +323,46 @@ class City(db.Model):
             'popular_score': self.popular_score,
             'avg_cost_per_day': self.avg_cost_per_day,
             'best_time_to_visit': self.best_time_to_visit,
-            'activity_count': len(self.activities) if self.activities else 0
+            'activity_count': self.activity_count or 0
         }
 
+    @staticmethod
+    def adjust_activity_count(city_id, delta):
+        """Add `delta` to a city's activity_count in SQL, without loading it"""
+        City.query.filter_by(city_id=city_id).update(
+            {City.activity_count: City.activity_count + delta}, synchronize_session=False
+        )
+
 
 class Activity(db.Model):
     """Activity model for storing activities in each city"""
     __tablename__ = 'activities'
     
     activity_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    city_id = db.Column(db.String(36), db.ForeignKey('cities.city_id'), nullable=False)
+    city_id = db.Column(db.String(36), db.ForeignKey('cities.city_id', ondelete='CASCADE'), nullable=False)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, default='')
     category = db.Column(db.String(50), default='sightseeing')  # sightseeing, food, shopping, adventure, relaxation, spiritual
-    estimated_cost = db.Column(db.Float, default=0.0)  # Cost in INR
+    estimated_cost = db.Column(db.Float, default=0.0, nullable=False)  # Cost in INR
     duration_hours = db.Column(db.Float, default=2.0)  # Time in hours
     image_url = db.Column(db.String(500), default='')
-    rating = db.Column(db.Float, default=4.0)  # 1-5 rating
+    rating = db.Column(db.Float, default=4.0, nullable=False)  # 1-5 rating
     tips = db.Column(db.Text, default='')  # Travel tips
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_activities_rating', 'rating', 'activity_id'),
+        db.Index('ix_activities_city_rating', 'city_id', 'rating'),
+        db.Index('ix_activities_category_cost', 'category', 'estimated_cost'),
+    )
+
+    @classmethod
+    def query_with_city(cls):
+        """Activity query that eager-loads only the city columns to_dict needs"""
+        return cls.query.options(
+            defer(cls.created_at),
+            joinedload(cls.city).load_only(City.city_id, City.name, City.state)
+        )
 
     def to_dict(self):
         return {
@@ -149,3 +379,44 @@ class Activity(db.Model):
             'rating': self.rating,
             'tips': self.tips
         }
+
+
+class Job(db.Model):
+    """A unit of background work, claimed and run by `flask jobs worker` (see jobs.py)"""
+    __tablename__ = 'jobs'
+
+    job_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(50), nullable=False)  # A handler registered with jobs.job_handler
+    payload_json = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Pushed back between retries
+    locked_by = db.Column(db.String(100))  # Worker running it
+    locked_at = db.Column(db.DateTime)
+    result_json = db.Column(db.Text)
+    error = db.Column(db.Text)
+    # Who may see the job's status; not a foreign key, since a job may outlive its user (account deletion)
+    user_id = db.Column(db.String(36))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Workers claim the oldest ready job
+        db.Index('ix_jobs_queue', 'status', 'run_after'),
+        db.Index('ix_jobs_created', 'created_at', 'job_id'),
+        db.Index('ix_jobs_user', 'user_id', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': json.loads(self.result_json) if self.result_json else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,89 @@
+"""
+Payanam - Page Script Check
+Render the HTML pages and run `node --check` on every inline <script> they contain
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from query_plans import sample_values
+
+# Pages rendered for a signed-in user (and admin); placeholders are filled
+# from sample rows like the query plan check's routes
+PAGES = [
+    '/dashboard',
+    '/trips',
+    '/trip/create',
+    '/trip/{trip_id}',
+    '/trip/{trip_id}/edit',
+    '/trip/{trip_id}/itinerary',
+    '/trip/{trip_id}/timeline',
+    '/trip/{trip_id}/budget',
+    '/shared/{share_code}',
+    '/cities',
+    '/activities',
+    '/profile',
+    '/analytics',
+    '/admin',
+]
+
+# Pages that only render for visitors who are signed out
+ANONYMOUS_PAGES = [
+    '/',
+    '/login',
+    '/signup',
+    '/admin/login',
+]
+
+_INLINE_SCRIPT = re.compile(r'<script(?![^>]*\bsrc=)[^>]*>(.*?)</script>', re.S | re.I)
+
+
+def inline_scripts(html):
+    return [script for script in _INLINE_SCRIPT.findall(html) if script.strip()]
+
+
+def syntax_error(script):
+    """node's complaint about `script`, or None if it parses"""
+    with tempfile.NamedTemporaryFile('w', suffix='.js', delete=False, encoding='utf-8') as f:
+        f.write(script)
+    try:
+        result = subprocess.run(['node', '--check', f.name], capture_output=True, text=True)
+    finally:
+        os.unlink(f.name)
+    if result.returncode == 0:
+        return None
+    lines = [line for line in result.stderr.splitlines() if line.strip()]
+    # node prints "file:line", the offending source line, a caret, then the error
+    location = lines[0].rsplit(':', 1)[-1] if lines else '?'
+    message = next((line for line in lines if 'Error' in line), result.stderr.strip())
+    return f'line {location}: {message}'
+
+
+def check_page_scripts(app):
+    """Render every page in PAGES and ANONYMOUS_PAGES and return
+    [(url, problem)] for each page that failed or whose scripts do not parse"""
+    if shutil.which('node') is None:
+        raise RuntimeError('The page script check needs Node.js (`node`) on the PATH')
+
+    with app.app_context():
+        values = sample_values()
+    user = app.test_client()
+    with user.session_transaction() as session:
+        session['user_id'] = values['user_id']
+        session['is_admin'] = True
+
+    problems = []
+    for client, pages in ((user, PAGES), (app.test_client(), ANONYMOUS_PAGES)):
+        for page in pages:
+            url = page.format(**values)
+            response = client.get(url)
+            if response.status_code != 200:
+                problems.append((url, f'HTTP {response.status_code}'))
+                continue
+            for number, script in enumerate(inline_scripts(response.get_data(as_text=True)), 1):
+                error = syntax_error(script)
+                if error:
+                    problems.append((url, f'script {number}, {error}'))
+    return problems
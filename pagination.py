@@ -0,0 +1,107 @@
+"""
+Payanam - Keyset Pagination
+Cursor-based paging over the existing sort keys, with the primary key as tiebreaker
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorError(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def page_size(requested, default=DEFAULT_PAGE_SIZE):
+    """Clamp a requested page size into 1..MAX_PAGE_SIZE"""
+    if not requested or requested < 1:
+        return default
+    return min(requested, MAX_PAGE_SIZE)
+
+
+def _tag(value):
+    # Dates and datetimes are not JSON; tag them so they decode back to the same type
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _untag(value):
+    if not isinstance(value, dict):
+        return value
+    if 'd' in value:
+        return date.fromisoformat(value['d'])
+    return datetime.fromisoformat(value['dt'])
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe cursor for the sort-key values of the last row served"""
+    tagged = [_tag(v) for v in values]
+    return base64.urlsafe_b64encode(json.dumps(tagged).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != length:
+            raise ValueError
+        return [_untag(v) for v in values]
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise CursorError('Invalid cursor')
+
+
+def _nullable(expr):
+    # Mapped attributes wrap their Column; labels and functions have no nullable
+    return getattr(getattr(expr, 'expression', expr), 'nullable', False)
+
+
+def _after(order, values):
+    """WHERE clause selecting the rows that sort after `values`"""
+    directions = {descending for _expr, descending in order}
+    if len(directions) == 1:
+        # Same direction everywhere: a row-value comparison SQLite can seek with an index
+        columns = tuple_(*(expr for expr, _descending in order))
+        return columns < tuple_(*values) if directions.pop() else columns > tuple_(*values)
+
+    clauses = []
+    for i, (expr, descending) in enumerate(order):
+        equal = [order[j][0] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, expr < values[i] if descending else expr > values[i]))
+    return or_(*clauses)
+
+
+def keyset_page(query, order, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Fetch one page of `query`.
+
+    `order` is a list of (expression, descending) pairs whose last entry is
+    unique (the primary key). Rows after `cursor` are selected with a
+    WHERE on the sort keys rather than an OFFSET, so deep pages cost the
+    same as the first one. Sort keys must be NOT NULL: a NULL compares as
+    neither before nor after the cursor, so its row would never be served.
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    Items are entities for single-entity queries, tuples otherwise.
+    """
+    nullable = [str(expr) for expr, _descending in order if _nullable(expr)]
+    if nullable:
+        raise ValueError(f"Nullable sort keys: {', '.join(nullable)}")
+    if cursor:
+        query = query.filter(_after(order, decode_cursor(cursor, len(order))))
+
+    keys = len(order)
+    rows = query.add_columns(*(expr for expr, _descending in order)).order_by(
+        *(expr.desc() if descending else expr.asc() for expr, descending in order)
+    ).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [row[0] if len(row) == keys + 1 else tuple(row[:-keys]) for row in rows]
+    next_cursor = encode_cursor(list(rows[-1][-keys:])) if has_more and rows else None
+    return items, next_cursor
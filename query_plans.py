@@ -0,0 +1,128 @@
+"""
+Payanam - Query Plan Check
+Request the hot routes, EXPLAIN QUERY PLAN every SELECT they run, flag full scans
+"""
+
+import re
+from urllib.parse import urlencode
+from sqlalchemy import event
+from models import db, Trip, City, Activity
+
+# Routes whose queries must be served by indexes. Placeholders are filled
+# from sample rows; list endpoints are also checked on their second page.
+ROUTES = [
+    '/dashboard',
+    '/trips',
+    '/profile',
+    '/analytics',
+    '/cities',
+    '/activities',
+    '/api/trips?limit=2',
+    '/api/trips?upcoming=1&limit=2',
+    '/api/trips?from={trip_start}&to={trip_end}',
+    '/api/trips?month={trip_month}',
+    '/api/analytics',
+    '/api/cities?limit=5',
+    '/api/cities?state={state}',
+    '/api/cities?category={city_category}',
+    '/api/cities?search={city_name}',
+    '/api/cities/{city_id}',
+    '/api/cities/{city_id}/activities',
+    '/api/cities/by-name/{city_name}/activities',
+    '/api/cities/by-name/{city_name}/planned-activities',
+    '/api/activities?limit=5',
+    '/api/activities?city_id={city_id}',
+    '/api/activities?category={activity_category}&min_cost=100&max_cost=2000',
+    '/api/activities?search={activity_name}',
+    '/api/activities/frontend-format?limit=5',
+    '/api/trip/{trip_id}/itinerary',
+    '/trip/{trip_id}',
+    '/trip/{trip_id}/timeline',
+    '/trip/{trip_id}/budget',
+    '/shared/{share_code}',
+    '/admin',
+    '/admin/api/users?limit=2',
+    '/admin/api/trips?limit=2',
+    '/admin/api/cities?limit=5',
+    '/admin/api/activities?limit=5',
+    '/admin/api/jobs?limit=2',
+]
+
+# A plan step reading a whole table: "SCAN trips", but not "SCAN trips USING
+# (COVERING) INDEX ...", a virtual (FTS) table, or a subquery/CTE result
+_FULL_SCAN = re.compile(r'^SCAN (?!.*\b(USING|VIRTUAL TABLE)\b)(\w+)')
+_SUBQUERY = re.compile(r'^(anon_|sqlite_|\(subquery)')
+
+
+def sample_values():
+    trip = Trip.query.filter(Trip.is_public.is_(True)).first() or Trip.query.first()
+    city = City.query.order_by(City.popular_score.desc()).first()
+    activity = Activity.query.first()
+    if not (trip and city and activity):
+        raise RuntimeError('The query plan check needs at least one trip, city and activity')
+    return {
+        'user_id': trip.user_id,
+        'trip_id': trip.trip_id,
+        'share_code': trip.share_code,
+        'trip_start': trip.start_date.isoformat(),
+        'trip_end': trip.end_date.isoformat(),
+        'trip_month': trip.start_date.strftime('%Y-%m'),
+        'state': city.state,
+        'city_category': city.category,
+        'city_id': city.city_id,
+        'city_name': city.name,
+        'activity_category': activity.category,
+        'activity_name': activity.name,
+    }
+
+
+def full_scans(conn, statement, parameters):
+    """Tables that `statement` reads in full"""
+    plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    tables = []
+    for row in plan:
+        match = _FULL_SCAN.match(row[-1])
+        if match and not _SUBQUERY.match(match.group(2)):
+            tables.append(match.group(2))
+    return tables
+
+
+def check_query_plans(app):
+    """Run every route in ROUTES and return [(route, table, sql)] for each full
+    table scan found in the SELECTs it issued"""
+    with app.app_context():
+        values = sample_values()
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = values['user_id']
+            session['is_admin'] = True
+
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                captured.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        problems = []
+        try:
+            for route in ROUTES:
+                url = route.format(**values)
+                captured.clear()
+                response = client.get(url)
+                if response.status_code != 200:
+                    problems.append((url, None, f'HTTP {response.status_code}'))
+                    continue
+                data = response.get_json(silent=True)
+                if isinstance(data, dict) and data.get('next_cursor'):
+                    separator = '&' if '?' in url else '?'
+                    client.get(url + separator + urlencode({'cursor': data['next_cursor']}))
+
+                statements = list(captured)
+                with db.engine.connect() as conn:
+                    for statement, parameters in statements:
+                        for table in full_scans(conn, statement, parameters):
+                            problems.append((url, table, statement))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        return problems
@@ -0,0 +1,182 @@
+"""
+Payanam - Full-Text Search
+SQLite FTS5 indexes over the city/activity catalog, kept in sync by triggers
+"""
+
+import re
+from contextlib import contextmanager
+from sqlalchemy import text, table, column, select, literal_column, false
+from models import db, City, Activity
+from jobs import job_handler, JobError
+
+# City name matches outrank state matches, which outrank description matches
+CITY_RANK = 'bm25(cities_fts, 0.0, 10.0, 5.0, 1.0)'
+ACTIVITY_RANK = 'bm25(activities_fts, 0.0, 10.0, 2.0, 1.0)'
+
+SEARCH_DDL = [
+    # Standalone FTS tables: the text primary keys of cities/activities are
+    # not rowid aliases (VACUUM may renumber rowids), so the id is stored
+    # as an UNINDEXED column and used to join back.
+    """CREATE VIRTUAL TABLE IF NOT EXISTS cities_fts USING fts5(
+        city_id UNINDEXED, name, state, description,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS activities_fts USING fts5(
+        activity_id UNINDEXED, name, description, tips,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS cities_fts_insert AFTER INSERT ON cities BEGIN
+        INSERT INTO cities_fts(city_id, name, state, description)
+        VALUES (new.city_id, new.name, new.state, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cities_fts_delete AFTER DELETE ON cities BEGIN
+        DELETE FROM cities_fts WHERE city_id = old.city_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cities_fts_update
+    AFTER UPDATE OF city_id, name, state, description ON cities BEGIN
+        DELETE FROM cities_fts WHERE city_id = old.city_id;
+        INSERT INTO cities_fts(city_id, name, state, description)
+        VALUES (new.city_id, new.name, new.state, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS activities_fts_insert AFTER INSERT ON activities BEGIN
+        INSERT INTO activities_fts(activity_id, name, description, tips)
+        VALUES (new.activity_id, new.name, new.description, new.tips);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS activities_fts_delete AFTER DELETE ON activities BEGIN
+        DELETE FROM activities_fts WHERE activity_id = old.activity_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS activities_fts_update
+    AFTER UPDATE OF activity_id, name, description, tips ON activities BEGIN
+        DELETE FROM activities_fts WHERE activity_id = old.activity_id;
+        INSERT INTO activities_fts(activity_id, name, description, tips)
+        VALUES (new.activity_id, new.name, new.description, new.tips);
+    END""",
+]
+
+SEARCH_TRIGGERS = [re.search(r'TRIGGER IF NOT EXISTS (\w+)', ddl).group(1)
+                   for ddl in SEARCH_DDL if 'TRIGGER' in ddl]
+
+cities_fts = table('cities_fts', column('city_id'), column('cities_fts'))
+activities_fts = table('activities_fts', column('activity_id'), column('activities_fts'))
+
+# None until first checked; False when the FTS tables were never installed
+# (e.g. SQLite built without FTS5), in which case search falls back to LIKE
+_search_enabled = None
+
+
+def install_search_index(conn):
+    """Create the FTS tables and sync triggers, then (re)fill them"""
+    for statement in SEARCH_DDL:
+        conn.execute(text(statement))
+    rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn):
+    """Repopulate both FTS tables from the catalog tables"""
+    conn.execute(text("DELETE FROM cities_fts"))
+    conn.execute(text(
+        "INSERT INTO cities_fts(city_id, name, state, description) "
+        "SELECT city_id, name, state, description FROM cities"
+    ))
+    conn.execute(text("DELETE FROM activities_fts"))
+    conn.execute(text(
+        "INSERT INTO activities_fts(activity_id, name, description, tips) "
+        "SELECT activity_id, name, description, tips FROM activities"
+    ))
+
+
+@job_handler('reindex_catalog')
+def _reindex_catalog_job(payload):
+    with db.engine.begin() as conn:
+        if not search_index_installed(conn):
+            raise JobError('The search index is not installed (SQLite without FTS5)')
+        rebuild_search_index(conn)
+        return {'cities': conn.execute(text("SELECT COUNT(*) FROM cities_fts")).scalar(),
+                'activities': conn.execute(text("SELECT COUNT(*) FROM activities_fts")).scalar()}
+
+
+@contextmanager
+def search_sync_suspended():
+    """Drop the FTS sync triggers for a bulk load and rebuild the index after it.
+
+    The update triggers find the old FTS row by its UNINDEXED id, a scan of
+    the FTS table per row: fine for an admin edit, quadratic for an upsert
+    of the whole catalog. Rebuilding once at the end is linear.
+    """
+    with db.engine.begin() as conn:
+        installed = search_index_installed(conn)
+        if installed:
+            for name in SEARCH_TRIGGERS:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    try:
+        yield
+    finally:
+        if installed:
+            with db.engine.begin() as conn:
+                install_search_index(conn)
+
+
+def search_index_installed(conn):
+    """Whether the FTS tables exist (migration 2 skips them without FTS5)"""
+    return conn.execute(text("SELECT COUNT(*) FROM sqlite_master WHERE name = 'cities_fts'")).scalar() > 0
+
+
+def fts5_available(conn):
+    """Whether this SQLite build ships the FTS5 extension"""
+    return bool(conn.execute(text(
+        "SELECT sqlite_compileoption_used('ENABLE_FTS5')"
+    )).scalar())
+
+
+def search_enabled():
+    """Whether the FTS tables exist in the current database"""
+    global _search_enabled
+    if _search_enabled is None:
+        _search_enabled = search_index_installed(db.session)
+    return _search_enabled
+
+
+def match_expression(user_query):
+    """Turn free text into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term ("jai"*), so operators and
+    punctuation typed by the user can never produce a syntax error.
+    Returns None when the text contains no searchable words.
+    """
+    words = re.findall(r'\w+', user_query or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_cities(query, user_query):
+    """Restrict a City query to full-text matches.
+
+    Returns (query, rank): order by `rank` ascending for best matches first.
+    rank is None when there is no relevance to order by (LIKE fallback).
+    """
+    expression = match_expression(user_query)
+    if expression is None:
+        return query.filter(false()), None
+    if not search_enabled():
+        return query.filter(City.name.ilike(f'%{user_query}%')), None
+
+    matches = select(cities_fts.c.city_id, literal_column(CITY_RANK).label('rank')).where(
+        cities_fts.c.cities_fts.op('MATCH')(expression)
+    ).subquery()
+    return query.join(matches, City.city_id == matches.c.city_id), matches.c.rank
+
+
+def search_activities(query, user_query):
+    """Restrict an Activity query to full-text matches; returns (query, rank)
+    like search_cities()"""
+    expression = match_expression(user_query)
+    if expression is None:
+        return query.filter(false()), None
+    if not search_enabled():
+        return query.filter(Activity.name.ilike(f'%{user_query}%')), None
+
+    matches = select(activities_fts.c.activity_id, literal_column(ACTIVITY_RANK).label('rank')).where(
+        activities_fts.c.activities_fts.op('MATCH')(expression)
+    ).subquery()
+    return query.join(matches, Activity.activity_id == matches.c.activity_id), matches.c.rank
@@ -0,0 +1,122 @@
+"""
+Payanam - Shared Page Cache
+Rendered /shared/<share_code> pages, served after one indexed lookup
+
+Pages are cached per share_code, in memory and optionally on disk
+(SHARED_PAGE_CACHE_DIR) so they survive restarts. Each page is stored
+with the updated_at of the trip it was rendered from, and only served
+while the public trip still has that updated_at. A trip made private,
+deleted or edited in any process - another worker, the job worker, a
+CLI import - therefore stops being served everywhere at once. Dropping
+pages on commit only frees the space.
+"""
+
+import glob
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Trip
+
+# Most recently served pages kept in memory per process
+MAX_PAGES = 256
+
+# share_code -> {'html': str, 'version': str}
+_pages = OrderedDict()
+_lock = threading.Lock()
+
+
+def page_version(updated_at):
+    """The version a page is cached under: its trip's updated_at, as digits"""
+    return updated_at.strftime('%Y%m%d%H%M%S%f') if updated_at else '0'
+
+
+def _cache_dir():
+    return current_app.config.get('SHARED_PAGE_CACHE_DIR') if has_app_context() else None
+
+
+def _page_path(directory, share_code, version):
+    return os.path.join(directory, f'{share_code}.{version}.html')
+
+
+def get_page(share_code, version):
+    """Cached HTML for `share_code` rendered at `version`, or None"""
+    with _lock:
+        entry = _pages.get(share_code)
+        if entry is not None and entry['version'] == version:
+            _pages.move_to_end(share_code)
+            return entry['html']
+
+    directory = _cache_dir()
+    if directory is None:
+        return None
+    try:
+        with open(_page_path(directory, share_code, version), encoding='utf-8') as f:
+            entry = {'html': f.read(), 'version': version}
+    except FileNotFoundError:
+        return None
+    _remember(share_code, entry)
+    return entry['html']
+
+
+def store_page(share_code, version, html):
+    """Cache a page rendered from the trip as of `version`"""
+    directory = _cache_dir()
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        path = _page_path(directory, share_code, version)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+    _remember(share_code, {'html': html, 'version': version})
+
+
+def _remember(share_code, entry):
+    with _lock:
+        _pages[share_code] = entry
+        _pages.move_to_end(share_code)
+        while len(_pages) > MAX_PAGES:
+            _pages.popitem(last=False)
+
+
+def invalidate_pages(share_codes, directory=None):
+    """Drop the cached pages of `share_codes`, in every version"""
+    with _lock:
+        for share_code in share_codes:
+            _pages.pop(share_code, None)
+    if directory is not None:
+        for share_code in share_codes:
+            for path in glob.glob(_page_path(glob.escape(directory), glob.escape(share_code), '*')):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def invalidate_trip_pages(share_codes):
+    """Drop cached pages of trips changed outside the ORM session (bulk imports)"""
+    invalidate_pages(share_codes, _cache_dir())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_pages(session, flush_context):
+    """Remember which shared pages this transaction makes stale"""
+    changed = session.info.setdefault('stale_shared_pages', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Trip) and obj.share_code:
+            changed.add(obj.share_code)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_pages(session):
+    changed = session.info.pop('stale_shared_pages', None)
+    if changed:
+        invalidate_pages(changed, _cache_dir())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_stale_pages(session):
+    session.info.pop('stale_shared_pages', None)
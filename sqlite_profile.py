@@ -0,0 +1,110 @@
+"""
+Payanam - SQLite Profile
+Per-connection PRAGMAs and pool settings, selectable through environment variables
+
+DB_PROFILE picks a preset ('performance' by default, 'durable' or 'legacy');
+any single setting can be overridden with its SQLITE_* variable.
+"""
+
+import os
+import sqlite3
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+PROFILES = {
+    # WAL lets readers run alongside the single writer; NORMAL sync is
+    # crash-safe in WAL mode and only risks the last commits on power loss.
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,        # ms to wait for a lock before "database is locked"
+        'cache_size': -16000,        # negative = KiB, per connection
+        'mmap_size': 268435456,      # 256 MiB of the file read through mmap
+        'temp_store': 'MEMORY',
+    },
+    # Same concurrency, but every commit is fsynced
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 0,
+        'temp_store': 'MEMORY',
+    },
+    # SQLite defaults (rollback journal), as before profiles existed
+    'legacy': {},
+}
+
+PRAGMA_ENV = {
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'temp_store': 'SQLITE_TEMP_STORE',
+}
+
+# The PRAGMAs applied to new connections; set by configure()
+_pragmas = {}
+
+
+def profile_pragmas():
+    """The PRAGMAs of the selected profile with SQLITE_* overrides applied"""
+    name = os.getenv('DB_PROFILE', 'performance')
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}; expected one of {', '.join(PROFILES)}")
+    pragmas = dict(PROFILES[name])
+    for pragma, variable in PRAGMA_ENV.items():
+        value = os.getenv(variable)
+        if value:
+            pragmas[pragma] = value
+    for pragma, value in pragmas.items():
+        if not str(value).lstrip('-').isalnum():
+            raise ValueError(f'Invalid value for PRAGMA {pragma}: {value!r}')
+    return pragmas
+
+
+def engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_uri`"""
+    if not database_uri.startswith('sqlite'):
+        return {}
+    options = {'connect_args': {
+        # Flask may hand a pooled connection to another thread
+        'check_same_thread': False,
+    }}
+    if ':memory:' not in database_uri and database_uri not in ('sqlite://', 'sqlite:///'):
+        # File databases get a real pool: one connection per concurrent request
+        options.update({
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        })
+    return options
+
+
+def configure(app):
+    """Fill in the engine options and PRAGMAs for `app`; call before db.init_app()"""
+    global _pragmas
+    _pragmas = profile_pragmas()
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    if 'busy_timeout' in _pragmas and 'connect_args' in options:
+        # The driver's own lock wait, matched to busy_timeout
+        options['connect_args']['timeout'] = int(_pragmas['busy_timeout']) / 1000
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update(options)
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # Not a tuning knob: ON DELETE CASCADE and the other constraints depend on it
+    cursor.execute("PRAGMA foreign_keys = ON")
+    for pragma, value in _pragmas.items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+
+def current_pragmas(conn):
+    """The values SQLite actually uses, for checking a deployment"""
+    return {pragma: conn.execute(text(f"PRAGMA {pragma}")).scalar() for pragma in (*PRAGMA_ENV, 'foreign_keys')}
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+from flask import Flask
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A bare app on a throwaway, fully migrated SQLite database"""
+    import sqlite_profile
+    from models import db
+    from migrations import upgrade
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'payanam.db'}"
+    app.config['EXPORT_DIR'] = str(tmp_path / 'exports')
+    sqlite_profile.configure(app)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,134 @@
+import io
+import json
+import pytest
+from sqlalchemy import text
+from bulk_import import (RowError, CITY_FIELDS, TRIP_FIELDS, _check_trip, _flag, _number, batches,
+                         detect_format, import_cities, import_trips, read_rows, validate)
+from models import db, User
+
+ITINERARY = {'stops': [{'city_name': 'Jaipur', 'days': [
+    {'day_number': 1, 'activities': [{'name': 'Amber Fort', 'estimated_cost': 500}]}]}]}
+
+
+def trip_row(**fields):
+    row = {'trip_id': 't1', 'user_id': 'u1', 'trip_name': 'Rajasthan',
+           'start_date': '2025-01-10', 'end_date': '2025-01-12', 'itinerary': ITINERARY}
+    row.update(fields)
+    return row
+
+
+@pytest.mark.parametrize('filename, fmt', [
+    ('cities.csv', 'csv'), ('trips.NDJSON', 'ndjson'), ('a.jsonl', 'ndjson'), ('b.json', 'ndjson'), ('-', 'csv'),
+])
+def test_detect_format(filename, fmt):
+    assert detect_format(filename) == fmt
+
+
+def test_read_rows_csv_numbers_lines():
+    rows = list(read_rows(io.StringIO('city_id,name\nc1,Jaipur\nc2,Udaipur\n'), 'csv'))
+    assert rows == [(2, {'city_id': 'c1', 'name': 'Jaipur'}), (3, {'city_id': 'c2', 'name': 'Udaipur'})]
+
+
+def test_read_rows_ndjson_flags_bad_lines():
+    stream = io.StringIO('{"name": "Jaipur"}\n\nnot json\n[1, 2]\n{"name": "Udaipur"}\n')
+    rows = list(read_rows(stream, 'ndjson'))
+    assert [line for line, _row in rows] == [1, 3, 4, 5]
+    assert rows[0][1] == {'name': 'Jaipur'}
+    assert isinstance(rows[1][1], RowError) and 'invalid JSON' in str(rows[1][1])
+    assert str(rows[2][1]) == 'expected a JSON object'
+    with pytest.raises(RowError):
+        validate(CITY_FIELDS, rows[1][1])
+
+
+def test_batches():
+    assert list(batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batches([], 3)) == []
+
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True), ('', False), (None, False), (' Yes ', True), ('1', True), ('n', False), ('FALSE', False),
+])
+def test_flag(value, expected):
+    assert _flag(value) is expected
+
+
+def test_flag_rejects_other_text():
+    with pytest.raises(RowError):
+        _flag('maybe')
+
+
+def test_number_defaults_converts_and_bounds():
+    rating = _number(float, 4.0, minimum=0, maximum=5)
+    assert rating('') == 4.0
+    assert rating(' 3.5 ') == 3.5
+    for value in ('abc', '-1', '6'):
+        with pytest.raises(RowError):
+            rating(value)
+
+
+def test_validate_city_fills_defaults():
+    values = validate(CITY_FIELDS, {'name': ' Jaipur ', 'state': 'Rajasthan', 'popular_score': '7'})
+    assert values['name'] == 'Jaipur'
+    assert values['popular_score'] == 7
+    assert values['category'] == 'heritage'
+    assert len(values['city_id']) == 36
+
+
+@pytest.mark.parametrize('row, message', [
+    ({'state': 'Rajasthan'}, 'name is required'),
+    ({'name': 'x' * 101, 'state': 'Rajasthan'}, 'name is longer than 100 characters'),
+    ({'name': 'Jaipur', 'state': 'Rajasthan', 'created_at': 'yesterday'}, 'created_at is not an ISO timestamp'),
+])
+def test_validate_city_errors_name_the_column(row, message):
+    with pytest.raises(RowError, match=message):
+        validate(CITY_FIELDS, row)
+
+
+def test_check_trip_derives_budget_and_summary():
+    values = _check_trip(trip_row(itinerary=json.dumps(ITINERARY)))
+    assert values['total_budget'] == 500
+    assert values['itinerary'] == ITINERARY
+    assert len(values['share_code']) == 8
+    assert set(values) >= set(TRIP_FIELDS)
+
+
+@pytest.mark.parametrize('fields, message', [
+    ({'end_date': '2025-01-01'}, 'end_date is before start_date'),
+    ({'start_date': ''}, 'start_date is required'),
+    ({'user_id': ''}, 'user_id is required'),
+    ({'total_budget': '-5'}, 'total_budget must be between'),
+    ({'is_public': 'maybe'}, 'is_public is not a boolean'),
+    ({'itinerary': '{bad'}, 'itinerary is not valid JSON'),
+    ({'itinerary': {'stops': 'Jaipur'}}, 'itinerary must be an object with a "stops" list'),
+])
+def test_check_trip_errors(fields, message):
+    with pytest.raises(RowError, match=message):
+        _check_trip(trip_row(**fields))
+
+
+def test_import_cities_counts_duplicates_separately(app):
+    rows = enumerate([
+        {'city_id': 'c1', 'name': 'Jaipur', 'state': 'Rajasthan'},
+        {'city_id': 'c1', 'name': 'Pink City', 'state': 'Rajasthan'},
+        {'city_id': 'c2', 'state': 'Rajasthan'},
+    ], 1)
+    report = import_cities(rows)
+    assert (report['rows'], report['rejected'], report['duplicates']) == (1, 1, 1)
+    assert report['errors'] == ['line 3: name is required']
+    assert db.session.execute(text("SELECT name FROM cities WHERE city_id = 'c1'")).scalar() == 'Pink City'
+
+
+def test_import_trips_counts_only_rows_written(app):
+    db.session.add(User(user_id='u1', name='Asha', email='asha@example.com'))
+    db.session.commit()
+    rows = enumerate([
+        trip_row(trip_name='First'),
+        trip_row(trip_name='Second'),
+        trip_row(trip_id='t2', user_id='nobody'),
+        trip_row(trip_id='t3'),
+    ], 1)
+    report = import_trips(rows, batch_size=10)
+    assert (report['rows'], report['rejected'], report['duplicates']) == (2, 1, 1)
+    assert report['errors'] == ["line 3: unknown user 'nobody'"]
+    names = db.session.execute(text("SELECT trip_id, trip_name FROM trips ORDER BY trip_id")).all()
+    assert [tuple(row) for row in names] == [('t1', 'Second'), ('t3', 'Rajasthan')]
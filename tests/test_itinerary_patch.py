@@ -0,0 +1,84 @@
+import copy
+import pytest
+from itinerary_patch import PatchError, apply_patch, parse_pointer
+
+DOC = {
+    'stops': [
+        {'city_name': 'Jaipur', 'days': [{'day_number': 1, 'activities': []}]},
+        {'city_name': 'Udaipur', 'days': []},
+    ],
+    'notes': {'a/b': 1, 'm~n': 2},
+}
+
+
+def patched(*operations):
+    return apply_patch(copy.deepcopy(DOC), list(operations))
+
+
+def test_parse_pointer_unescapes_tokens():
+    assert parse_pointer('') == []
+    assert parse_pointer('/notes/a~1b') == ['notes', 'a/b']
+    assert parse_pointer('/notes/m~0n') == ['notes', 'm~n']
+    assert parse_pointer('/~01') == ['~1']
+
+
+@pytest.mark.parametrize('pointer', ['stops', 5, None])
+def test_parse_pointer_rejects_invalid(pointer):
+    with pytest.raises(PatchError):
+        parse_pointer(pointer)
+
+
+def test_add_inserts_into_arrays_and_objects():
+    doc = patched({'op': 'add', 'path': '/stops/1', 'value': {'city_name': 'Jodhpur'}},
+                  {'op': 'add', 'path': '/stops/-', 'value': {'city_name': 'Ajmer'}},
+                  {'op': 'add', 'path': '/title', 'value': 'Rajasthan'})
+    assert [stop['city_name'] for stop in doc['stops']] == ['Jaipur', 'Jodhpur', 'Udaipur', 'Ajmer']
+    assert doc['title'] == 'Rajasthan'
+
+
+def test_remove_and_replace():
+    doc = patched({'op': 'remove', 'path': '/stops/0'},
+                  {'op': 'replace', 'path': '/notes/a~1b', 'value': 3})
+    assert [stop['city_name'] for stop in doc['stops']] == ['Udaipur']
+    assert doc['notes'] == {'a/b': 3, 'm~n': 2}
+
+
+def test_move_and_copy():
+    doc = patched({'op': 'move', 'from': '/stops/0', 'path': '/stops/-'},
+                  {'op': 'copy', 'from': '/stops/0/city_name', 'path': '/first'})
+    assert [stop['city_name'] for stop in doc['stops']] == ['Udaipur', 'Jaipur']
+    assert doc['first'] == 'Udaipur'
+
+
+def test_added_values_are_copied():
+    value = {'city_name': 'Pushkar'}
+    doc = patched({'op': 'add', 'path': '/stops/0', 'value': value})
+    value['city_name'] = 'changed'
+    assert doc['stops'][0]['city_name'] == 'Pushkar'
+
+
+def test_test_op():
+    patched({'op': 'test', 'path': '/stops/0/city_name', 'value': 'Jaipur'})
+    with pytest.raises(PatchError, match='Test failed'):
+        patched({'op': 'test', 'path': '/stops/0/city_name', 'value': 'Goa'})
+
+
+@pytest.mark.parametrize('operations', [
+    {'op': 'add', 'path': '/stops/0', 'value': 1},               # not a list
+    [{'op': 'frobnicate', 'path': '/stops'}],                   # unknown op
+    [{'op': 'add', 'path': '/stops/0'}],                         # missing value
+    [{'op': 'remove', 'path': ''}],                              # document root
+    [{'op': 'remove', 'path': '/missing'}],
+    [{'op': 'remove', 'path': '/stops/2'}],                      # out of range
+    [{'op': 'add', 'path': '/stops/3', 'value': {}}],            # past the end
+    [{'op': 'remove', 'path': '/stops/01'}],                     # leading zero
+    [{'op': 'remove', 'path': '/stops/-1'}],
+    [{'op': 'remove', 'path': '/stops/-'}],                      # '-' only for add
+    [{'op': 'remove', 'path': '/stops/²'}],                      # non-ASCII digit
+    [{'op': 'add', 'path': '/stops/١', 'value': {}}],            # Arabic-Indic one
+    [{'op': 'add', 'path': '/stops/0/city_name/x', 'value': 1}],  # into a string
+    [{'op': 'move', 'from': '/stops', 'path': '/stops/0'}],      # into its own child
+])
+def test_invalid_patches_raise_patch_error(operations):
+    with pytest.raises(PatchError):
+        apply_patch(copy.deepcopy(DOC), operations)
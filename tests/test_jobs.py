@@ -0,0 +1,151 @@
+import json
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+import bulk_export
+from jobs import JOB_HANDLERS, JobError, claim_job, enqueue, prune_jobs, retry_job, run_job, run_next_job
+from models import db, Job
+
+calls = []
+
+
+@pytest.fixture(autouse=True)
+def handlers(monkeypatch):
+    """Test job kinds: 'echo' returns its payload, 'flaky' raises, 'broken' raises JobError"""
+    calls.clear()
+
+    def echo(payload):
+        calls.append(payload)
+        return payload
+
+    def flaky(payload):
+        calls.append(payload)
+        raise RuntimeError('try again')
+
+    def broken(payload):
+        raise JobError('cannot work')
+
+    for kind, handler in (('echo', echo), ('flaky', flaky), ('broken', broken)):
+        monkeypatch.setitem(JOB_HANDLERS, kind, handler)
+    monkeypatch.setenv('JOB_RETRY_DELAY', '30')
+
+
+def job(job_id):
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def make_ready(job_id):
+    db.session.execute(text("UPDATE jobs SET run_after = :now WHERE job_id = :id"),
+                       {'now': datetime.utcnow() - timedelta(seconds=1), 'id': job_id})
+    db.session.commit()
+
+
+def test_enqueue_rejects_unknown_kinds(app):
+    with pytest.raises(ValueError):
+        enqueue('no_such_kind')
+
+
+def test_claim_marks_the_oldest_ready_job_running(app):
+    first = enqueue('echo', {'n': 1})
+    second = enqueue('echo', {'n': 2})
+    make_ready(second)
+    claimed = claim_job('w1')
+    assert tuple(claimed) == (second, 'echo', json.dumps({'n': 2}), 1, 3)
+    assert (job(second).status, job(second).locked_by) == ('running', 'w1')
+    assert claim_job('w2')[0] == first
+    assert claim_job('w3') is None
+
+
+def test_success_records_the_result(app):
+    job_id = enqueue('echo', {'n': 1}, user_id='u1')
+    assert run_next_job('w1') == 'succeeded'
+    done = job(job_id)
+    assert done.to_dict()['result'] == {'n': 1}
+    assert (done.status, done.locked_by, done.user_id) == ('succeeded', None, 'u1')
+    assert done.finished_at is not None
+    assert run_next_job('w1') is None
+
+
+def test_failures_back_off_then_fail(app):
+    job_id = enqueue('flaky', max_attempts=2)
+    assert run_next_job('w1') == 'queued'
+    retried = job(job_id)
+    assert 'try again' in retried.error
+    assert retried.run_after > datetime.utcnow() + timedelta(seconds=25)
+    # Not ready again until its backoff has passed
+    assert claim_job('w1') is None
+
+    make_ready(job_id)
+    assert run_next_job('w1') == 'failed'
+    failed = job(job_id)
+    assert (failed.attempts, failed.status) == (2, 'failed')
+    assert failed.finished_at is not None
+    assert len(calls) == 2
+
+
+def test_job_error_fails_without_retrying(app):
+    job_id = enqueue('broken')
+    assert run_next_job('w1') == 'failed'
+    assert job(job_id).attempts == 1
+    assert 'cannot work' in job(job_id).error
+
+
+def test_unknown_kind_at_run_time_fails(app):
+    job_id = enqueue('echo')
+    claimed = claim_job('w1')
+    assert run_job(claimed[0], 'gone', *claimed[2:]) == 'failed'
+    assert 'No handler' in job(job_id).error
+
+
+def test_retry_requeues_only_failed_jobs(app):
+    failed = enqueue('broken')
+    run_next_job('w1')
+    assert retry_job(failed)
+    assert (job(failed).status, job(failed).attempts, job(failed).finished_at) == ('queued', 0, None)
+    assert not retry_job(failed)
+
+    succeeded = enqueue('echo')
+    run_next_job('w1')
+    assert not retry_job(succeeded)
+
+
+def test_abandoned_jobs_are_requeued_until_out_of_attempts(app, monkeypatch):
+    monkeypatch.setenv('JOB_LOCK_TIMEOUT', '60')
+    job_id = enqueue('echo', max_attempts=2)
+    claim_job('w1')
+    stale = datetime.utcnow() - timedelta(seconds=120)
+    db.session.execute(text("UPDATE jobs SET locked_at = :stale WHERE job_id = :id"), {'stale': stale, 'id': job_id})
+    db.session.commit()
+
+    reclaimed = claim_job('w2')
+    assert (reclaimed[0], reclaimed[3]) == (job_id, 2)
+    assert job(job_id).locked_by == 'w2'
+
+    db.session.execute(text("UPDATE jobs SET locked_at = :stale WHERE job_id = :id"), {'stale': stale, 'id': job_id})
+    db.session.commit()
+    assert claim_job('w3') is None
+    assert job(job_id).status == 'failed'
+    assert job(job_id).error == 'Worker stopped before the job finished'
+
+
+def test_prune_deletes_old_finished_jobs_and_export_files(app):
+    export = enqueue('export', {'kind': 'cities', 'format': 'ndjson', 'file': 'cities.ndjson'})
+    assert run_next_job('w1') == 'succeeded'
+    path = bulk_export.export_path('cities.ndjson')
+    assert os.path.exists(path)
+    open(path + '.part', 'w').close()
+    queued = enqueue('echo')
+
+    assert prune_jobs(datetime.utcnow() - timedelta(days=1)) == 0
+    assert prune_jobs(datetime.utcnow() + timedelta(seconds=1)) == 1
+    assert job(export) is None
+    assert job(queued).status == 'queued'
+    assert not os.path.exists(path) and not os.path.exists(path + '.part')
+
+
+def test_prune_tolerates_missing_export_files(app):
+    enqueue('export', {'kind': 'bogus', 'file': 'never-written.csv'})
+    assert run_next_job('w1') == 'failed'
+    assert prune_jobs(datetime.utcnow() + timedelta(seconds=1)) == 1
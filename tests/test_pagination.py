@@ -0,0 +1,85 @@
+from datetime import date, datetime
+import pytest
+from sqlalchemy import Column, Float, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+from pagination import CursorError, MAX_PAGE_SIZE, decode_cursor, encode_cursor, keyset_page, page_size
+
+Base = declarative_base()
+
+
+class Place(Base):
+    __tablename__ = 'places'
+    place_id = Column(Integer, primary_key=True)
+    score = Column(Integer, nullable=False)
+    name = Column(String(20), nullable=False)
+    rating = Column(Float)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        # Repeated scores so pages break in the middle of a tie
+        session.add_all(Place(place_id=i, score=i % 4, name=f'p{i % 3}') for i in range(1, 24))
+        session.commit()
+        yield session
+
+
+def walk(session, order, limit):
+    items, cursor, pages = [], None, 0
+    while True:
+        page, cursor = keyset_page(session.query(Place), order, cursor, limit)
+        items.extend(page)
+        pages += 1
+        if cursor is None:
+            return items, pages
+
+
+def test_cursor_round_trip_keeps_types():
+    values = [datetime(2024, 5, 1, 9, 30, 15, 250), date(2024, 5, 2), 4.5, 'abc-123', 7]
+    assert decode_cursor(encode_cursor(values), len(values)) == values
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor([1]), encode_cursor([{'x': 1}, 2]), '!!'])
+def test_decode_cursor_rejects_foreign_cursors(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, 2)
+
+
+def test_page_size_clamps():
+    assert page_size(None, default=10) == 10
+    assert page_size(0, default=10) == 10
+    assert page_size(-5, default=10) == 10
+    assert page_size(25) == 25
+    assert page_size(10 ** 6) == MAX_PAGE_SIZE
+
+
+@pytest.mark.parametrize('limit', [1, 4, 5, 23, 50])
+def test_walk_serves_every_row_once_in_order(session, limit):
+    order = [(Place.score, True), (Place.place_id, True)]
+    items, pages = walk(session, order, limit)
+    assert [p.place_id for p in items] == [p.place_id for p in sorted(
+        session.query(Place), key=lambda p: (p.score, p.place_id), reverse=True)]
+    assert pages == max(1, -(-23 // limit))
+
+
+def test_walk_with_mixed_directions(session):
+    order = [(Place.name, False), (Place.score, True), (Place.place_id, False)]
+    items, _pages = walk(session, order, 3)
+    assert [p.place_id for p in items] == [p.place_id for p in sorted(
+        session.query(Place), key=lambda p: (p.name, -p.score, p.place_id))]
+
+
+def test_nullable_sort_keys_are_refused(session):
+    # A NULL key is neither before nor after a cursor, so its row would be skipped
+    with pytest.raises(ValueError):
+        keyset_page(session.query(Place), [(Place.rating, True), (Place.place_id, True)])
+
+
+def test_app_sort_keys_are_not_null():
+    from models import Activity, City, Job, Trip, User
+    for column in (User.created_at, Trip.created_at, Trip.start_date, Trip.total_budget,
+                   City.popular_score, City.activity_count, City.created_at,
+                   Activity.rating, Activity.estimated_cost, Activity.created_at, Job.created_at):
+        assert not column.expression.nullable, column
@@ -0,0 +1,41 @@
+"""
+Payanam - Trip Dates
+Parsing of trip dates and the date-range filters used by trip listings
+"""
+
+import calendar
+from datetime import date, datetime
+
+
+class DateError(ValueError):
+    """A date or month parameter that could not be parsed"""
+
+
+def parse_date(value):
+    """A date from an ISO 'YYYY-MM-DD' string; dates pass through, None stays None"""
+    if value is None or isinstance(value, date):
+        return value.date() if isinstance(value, datetime) else value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise DateError(f"Invalid date {value!r}; expected YYYY-MM-DD") from None
+
+
+def month_range(value):
+    """(first day, last day) of a 'YYYY-MM' month"""
+    try:
+        year, month = (int(part) for part in str(value).split('-'))
+        return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+    except ValueError:
+        raise DateError(f"Invalid month {value!r}; expected YYYY-MM") from None
+
+
+def overlapping(model, start=None, end=None):
+    """Filter conditions for rows of `model` with at least one day in
+    [start, end]. Either bound may be None for an open-ended range."""
+    conditions = []
+    if end is not None:
+        conditions.append(model.start_date <= end)
+    if start is not None:
+        conditions.append(model.end_date >= start)
+    return conditions